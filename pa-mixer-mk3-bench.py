@@ -0,0 +1,689 @@
+#!/usr/bin/env python3
+
+import itertools as it, operator as op, functools as ft
+from collections import OrderedDict, Counter, namedtuple, deque
+from contextlib import contextmanager
+import os, sys, re, time, types, select, random, logging, threading, asyncio, importlib.util
+import json, tracemalloc
+
+from pulsectl import PulseOperationFailed
+
+
+def load_mixer_module(path=None, name='pa_mixer_mk3'):
+	'Imports pa-mixer-mk3.py script (not importable by name due to dashes) as a module.'
+	if not path:
+		path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'pa-mixer-mk3.py')
+	spec = importlib.util.spec_from_file_location(name, path)
+	mod = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(mod)
+	mod.log = mod.get_logger('main') # normally set in main()
+	return mod
+
+mk3 = load_mixer_module()
+get_logger = mk3.get_logger
+
+
+FakePulsePort = namedtuple('FakePulsePort', 'name description')
+FakePulseEvent = namedtuple('FakePulseEvent', 't facility index')
+
+class FakePulseVolume(object):
+	def __init__(self, values): self.values = list(values)
+	def __repr__(self): return '<FakePulseVolume {}>'.format(self.values)
+	@property
+	def value_flat(self): return (sum(self.values) / float(len(self.values))) if self.values else 0
+	@value_flat.setter
+	def value_flat(self, v): self.values = [v] * len(self.values)
+
+class FakePulseInfo(object):
+	'Stand-in for pulsectl.PulseSinkInfo and PulseSinkInputInfo objects.'
+
+	def __init__( self, t, index, name, proplist,
+			volume, mute=0, port_list=None, port_active=None ):
+		self.t, self.index, self.name, self.proplist = t, index, name, proplist
+		self.volume, self.mute = volume, mute
+		self.port_list, self.port_active = port_list or list(), port_active
+
+	def __repr__(self):
+		return '<FakePulseInfo {}[{}] {!r}: {} {}>'.format(
+			self.t, self.index, self.name, self.volume, 'M' if self.mute else '-' )
+
+	def copy(self):
+		'Returns detached copy, same as every new info-call to libpulse would.'
+		return FakePulseInfo( self.t, self.index, self.name, dict(self.proplist),
+			FakePulseVolume(self.volume.values), self.mute, self.port_list, self.port_active )
+
+
+class FakePulseServer(object):
+	'''Shared state of a fake pulse server, which any number of FakePulse clients can connect to.
+		All object changes are broadcast as events to connected clients, same as with libpulse.'''
+
+	def __init__(self, rtt=0):
+		self.rtt = rtt # seconds, simulated round-trip delay for every client request
+		self.objs = dict(sink=OrderedDict(), sink_input=OrderedDict())
+		self.clients, self.lock = list(), threading.RLock()
+		self.calls = Counter()
+		self._obj_index = dict(sink=it.count(), sink_input=it.count())
+
+	def call(self, client, name):
+		if not client.connected:
+			raise PulseOperationFailed('Not connected: {}'.format(name))
+		self.calls[name] += 1
+		if self.rtt and client.rtt_blocking: time.sleep(self.rtt)
+
+	def event(self, facility, ev_t, index):
+		ev = FakePulseEvent(ev_t, facility, index)
+		with self.lock: clients = list(self.clients)
+		for client in clients: client._event_push(ev)
+
+	def obj_new(self, t, name, proplist, volume=1.0, channels=2, **info_kws):
+		with self.lock:
+			index = next(self._obj_index[t])
+			obj = self.objs[t][index] = FakePulseInfo(
+				t, index, name, proplist, FakePulseVolume([volume] * channels), **info_kws )
+		self.event(t, 'new', index)
+		return obj
+
+	def obj_change(self, t, index, volume=None, mute=None, port=None, proplist=None):
+		with self.lock:
+			obj = self.objs[t].get(index)
+			if not obj: raise mk3.PulseIndexError(index)
+			if volume is not None: obj.volume.value_flat = volume
+			if mute is not None: obj.mute = int(mute)
+			if port is not None:
+				port = next((p for p in obj.port_list if p.name == port), None)
+				if not port: raise PulseOperationFailed('Unknown port')
+				obj.port_active = port
+			if proplist: obj.proplist.update(proplist)
+		self.event(t, 'change', index)
+
+	def obj_remove(self, t, index):
+		with self.lock:
+			if not self.objs[t].pop(index, None): return
+		self.event(t, 'remove', index)
+
+	def disconnect(self):
+		'Drops all client connections, as if server was restarted.'
+		with self.lock: clients, self.clients = self.clients, list()
+		for client in clients: client._disconnect()
+
+
+class FakePulse(object):
+	'''Duck-typed replacement for pulsectl.Pulse,
+			implementing only the subset of its API that is used in pa-mixer-mk3.
+		First argument is a FakePulseServer instance,
+			the rest are same as with pulsectl.Pulse, so this class can be used
+			instead of it via e.g. "ft.partial(FakePulse, server)".'''
+
+	rtt_blocking = True # False - simulated server round-trip delay is done by caller
+
+	def __init__( self, server, client_name=None,
+			server_addr=None, connect=True, threading_lock=False ):
+		self.server, self.client_name = server, client_name
+		self.connected, self.event_callback, self.event_masks = False, None, set()
+		self._events, self._events_cond, self._loop_stop = deque(), threading.Condition(), False
+		self._poll_func = self._poll_fds = None
+		self._polling = self._closed = False
+		if connect: self.connect()
+
+	def __enter__(self): return self
+	def __exit__(self, err_t, err, err_tb): self.close()
+
+	def connect(self, autospawn=False, wait=False, timeout=None):
+		with self.server.lock:
+			if self not in self.server.clients: self.server.clients.append(self)
+			self.connected = True
+
+	def close(self):
+		with self.server.lock:
+			try: self.server.clients.remove(self)
+			except ValueError: pass
+		self._disconnect()
+		with self._events_cond:
+			self._closed = True
+			if not self._polling: self._poll_fds_close() # otherwise closed after poll
+
+	def _disconnect(self):
+		with self._events_cond:
+			self.connected = False
+			self._notify()
+
+	def _poll_fds_close(self):
+		fds, self._poll_fds = self._poll_fds, None
+		if fds: list(map(os.close, fds))
+
+	def _notify(self, poll=True):
+		self._events_cond.notify_all()
+		if not (poll and self._poll_fds): return
+		try: os.write(self._poll_fds[1], b'.')
+		except BlockingIOError: pass
+
+	def _obj_list(self, t):
+		self.server.call(self, '{}_list'.format(t))
+		with self.server.lock: return list(obj.copy() for obj in self.server.objs[t].values())
+
+	def _obj_info(self, t, index):
+		self.server.call(self, '{}_info'.format(t))
+		with self.server.lock:
+			try: return self.server.objs[t][index].copy()
+			except KeyError: raise mk3.PulseIndexError(index) from None
+
+	sink_list = lambda s: s._obj_list('sink')
+	sink_input_list = lambda s: s._obj_list('sink_input')
+	sink_info = lambda s,index: s._obj_info('sink', index)
+	sink_input_info = lambda s,index: s._obj_info('sink_input', index)
+
+	def volume_set_all_chans(self, obj, vol):
+		self.server.call(self, 'volume_set')
+		obj.volume.value_flat = vol
+		self.server.obj_change(obj.t, obj.index, volume=vol)
+
+	def mute(self, obj, mute=True):
+		self.server.call(self, 'mute')
+		self.server.obj_change(obj.t, obj.index, mute=mute)
+		obj.mute = mute
+
+	def port_set(self, obj, port):
+		self.server.call(self, 'port_set')
+		if not isinstance(port, str): port = port.name
+		self.server.obj_change(obj.t, obj.index, port=port)
+		obj.port_active = next(p for p in obj.port_list if p.name == port)
+
+	def event_mask_set(self, *masks):
+		self.server.call(self, 'event_mask_set')
+		self.event_masks = set(masks)
+
+	def event_callback_set(self, func): self.event_callback = func
+
+	def _event_push(self, ev):
+		if ev.facility not in self.event_masks and 'all' not in self.event_masks: return
+		with self._events_cond:
+			self._events.append(ev)
+			self._notify()
+
+	def set_poll_func(self, func, func_err_handler=None):
+		'''Same as pulsectl.Pulse.set_poll_func(), with func used to wait for events in event_listen().
+			It is passed one fake connection fd, which becomes readable on events or disconnect,
+				and on event_listen_stop() while polling (but not before), same as with libpulse.'''
+		with self._events_cond:
+			if not self._poll_fds:
+				self._poll_fds = os.pipe()
+				for fd in self._poll_fds: os.set_blocking(fd, False)
+			self._poll_func = func
+
+	def event_listen(self, timeout=None, raise_on_disconnect=True):
+		'Same as pulsectl.Pulse.event_listen(), with same event_listen_stop() raciness.'
+		assert self.event_callback
+		deadline = timeout is not None and time.monotonic() + timeout
+		with self._events_cond: self._loop_stop = False
+		if self._poll_func: self._event_listen_poll(deadline)
+		else: self._event_listen_cond(deadline)
+		if raise_on_disconnect and not self.connected: raise mk3.PulseDisconnected()
+
+	def _event_listen_poll(self, deadline):
+		while True:
+			with self._events_cond:
+				ev = self._events.popleft() if self._events else None
+				if not ev:
+					if self._loop_stop or not self.connected: break
+					delay = deadline and deadline - time.monotonic()
+					if delay is not False and delay <= 0: break
+					fds, self._polling = self._poll_fds, True
+			if ev:
+				try: self.event_callback(ev)
+				except mk3.PulseLoopStop: break
+				continue
+			pfd = types.SimpleNamespace(fd=fds[0], events=select.POLLIN, revents=0)
+			try: self._poll_func([pfd], -0.001 if delay is False else delay) # -1ms = no timeout
+			finally:
+				with self._events_cond:
+					self._polling = False
+					if self._closed: self._poll_fds_close()
+			if not self._poll_fds: break
+			if not pfd.revents: continue
+			try:
+				while os.read(fds[0], 512): pass
+			except BlockingIOError: pass
+
+	def _event_listen_cond(self, deadline):
+		while True:
+			with self._events_cond:
+				while not (self._events or self._loop_stop or not self.connected):
+					delay = deadline and deadline - time.monotonic()
+					if delay is not False and delay <= 0: break
+					self._events_cond.wait(delay or None)
+				if self._loop_stop or not self._events: break
+				ev = self._events.popleft()
+			try: self.event_callback(ev)
+			except mk3.PulseLoopStop: break
+
+	def event_listen_stop(self):
+		with self._events_cond:
+			self._loop_stop = True
+			self._notify(poll=self._polling)
+
+
+class FakePulseAsync(object):
+	'''Duck-typed replacement for pulsectl_asyncio.PulseAsync, wrapping FakePulse,
+			with simulated round-trip delay being awaited instead of blocking.
+		Events from FakePulseServer (pushed from any thread) are passed
+			to subscribe_events() iterators via event loop, which is set on connect().'''
+
+	requests = set('sink_list sink_input_list sink_info'
+		' sink_input_info volume_set_all_chans mute port_set'.split())
+
+	def __init__(self, server, client_name=None, server_addr=None, loop=None):
+		self.server, self._loop, self._queues = server, loop, list()
+		self._pulse = FakePulse(server, client_name, connect=False)
+		self._pulse.rtt_blocking = False
+		self._pulse._event_push, self._pulse._disconnect = self._event_push, self._disconnect
+
+	@property
+	def connected(self): return self._pulse.connected
+
+	async def connect(self, autospawn=False, wait=False, timeout=None):
+		if not self._loop: self._loop = asyncio.get_running_loop()
+		self._pulse.connect()
+
+	def close(self): self._pulse.close()
+
+	async def __aenter__(self):
+		await self.connect()
+		return self
+	async def __aexit__(self, err_t, err, err_tb): self.close()
+
+	def __getattr__(self, k):
+		if k not in self.requests: raise AttributeError(k)
+		func = getattr(self._pulse, k)
+		async def request(*args, **kws):
+			if self.server.rtt: await asyncio.sleep(self.server.rtt)
+			return func(*args, **kws)
+		return request
+
+	def _event_push(self, ev):
+		masks = self._pulse.event_masks
+		if ev.facility not in masks and 'all' not in masks: return
+		for queue in list(self._queues): self._loop.call_soon_threadsafe(queue.put_nowait, ev)
+
+	def _disconnect(self):
+		self._pulse.connected = False
+		for queue in list(self._queues): self._loop.call_soon_threadsafe(queue.put_nowait, None)
+
+	async def subscribe_events(self, *masks):
+		self.server.call(self._pulse, 'event_mask_set')
+		self._pulse.event_masks = set(masks)
+		queue = asyncio.Queue()
+		self._queues.append(queue)
+		try:
+			while True:
+				ev = await queue.get()
+				if not ev: raise mk3.PulseDisconnected()
+				yield ev
+		finally: self._queues.remove(queue)
+
+
+class FakePulseLoad(object):
+	'''Scripted load generator for FakePulseServer.
+		Creates/changes/removes sinks and sink-inputs (streams) at configured rates (per second),
+			either from a background thread (start/stop) or synchronously via step() calls.
+		Uses seeded PRNG, so same parameters always produce same sequence of changes.'''
+
+	app_names = ( 'mpv:mpv', 'VLC media player:vlc', 'Firefox:firefox',
+		'Chromium:chromium', 'Skype:skype', 'Mumble:mumble', 'ALSA plug-in [game]:game',
+		'baresip:baresip', 'Asterisk:asterisk', 'FreeSWITCH:freeswitch' )
+	media_names = 'audio stream', 'Playback', 'Call #{n}', 'Track {n} - Ünïcødé ♫', 'Output'
+
+	def __init__( self, server, sinks=2, streams=10, streams_max=None,
+			rate_new=0, rate_change=0, rate_remove=0, rate_props=0,
+			apps=20, props=50, seed=0 ):
+		self.server, self.sinks, self.streams = server, sinks, streams
+		self.streams_max = streams_max or max(streams * 2, 10)
+		self.rates = OrderedDict([ ('new', rate_new),
+			('change', rate_change), ('remove', rate_remove), ('props', rate_props) ])
+		self.apps, self.props, self.rng = apps, props, random.Random(seed)
+		self.counts, self._thread, self._stop = Counter(), None, threading.Event()
+
+	def sink_new(self):
+		n = len(self.server.objs['sink'])
+		ports = list( FakePulsePort('analog-output-{}'.format(p), 'Port {}'.format(p))
+			for p in ['speaker', 'headphones'] )
+		props = {
+			'alsa.id': 'ID {} Analog'.format(n), 'alsa.driver_name': 'snd_hda_intel',
+			'device.api': 'alsa', 'device.string': 'front:{}'.format(n),
+			'device.description': 'Built-in Audio {}'.format(n),
+			'device.profile.name': 'analog-stereo' }
+		return self.server.obj_new( 'sink', 'alsa_output.fake-{}.analog-stereo'.format(n),
+			props, volume=self.rng.random(), port_list=ports, port_active=ports[0] )
+
+	def stream_new(self):
+		n = self.counts['stream_new'] = self.counts['stream_new'] + 1
+		app = self.rng.randrange(self.apps)
+		app_name, app_bin = self.app_names[app % len(self.app_names)].rsplit(':', 1)
+		if app >= len(self.app_names): app_name = '{} {}'.format(app_name, app)
+		props = {
+			'application.name': app_name, 'application.process.binary': app_bin,
+			'application.process.user': 'user{}'.format(app % 3),
+			'application.process.host': 'fakehost',
+			'application.process.id': str(1000 + app),
+			'media.name': self.rng.choice(self.media_names).format(n=n) }
+		for k in range(self.props - len(props)): # same-per-app padding, as in real proplists
+			props['fake.prop.{}'.format(k)] = 'value-{}-{}'.format(app, k)
+		return self.server.obj_new( 'sink_input',
+			'playback-{}'.format(n), props, volume=self.rng.random() )
+
+	def populate(self):
+		for n in range(self.sinks): self.sink_new()
+		for n in range(self.streams): self.stream_new()
+
+	def _pick_stream(self):
+		with self.server.lock: indexes = list(self.server.objs['sink_input'])
+		return indexes and self.rng.choice(indexes)
+
+	def step(self, action=None):
+		'Runs one (random, weighted by rates) or specified action, returns its name.'
+		if not action:
+			rates = list(self.rates.items())
+			action = self.rng.choices(
+				list(map(op.itemgetter(0), rates)), list(map(op.itemgetter(1), rates)) )[0]
+		streams = len(self.server.objs['sink_input'])
+		if action == 'new' and streams >= self.streams_max: action = 'remove'
+		elif action != 'new' and not streams: action = 'new'
+		if action == 'new': self.stream_new()
+		else:
+			index = self._pick_stream()
+			if action == 'change':
+				self.server.obj_change('sink_input', index, volume=self.rng.random())
+			elif action == 'props':
+				self.server.obj_change( 'sink_input', index,
+					proplist={'media.name': 'Track {}'.format(self.rng.randrange(1000))} )
+			elif action == 'remove': self.server.obj_remove('sink_input', index)
+			else: raise ValueError(action)
+		self.counts[action] += 1
+		return action
+
+	def run(self):
+		rate = sum(self.rates.values())
+		if rate <= 0: return
+		while not self._stop.wait(self.rng.expovariate(rate)): self.step()
+
+	def start(self):
+		self._stop.clear()
+		self._thread = threading.Thread(target=self.run, name='fake-load', daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread: self._thread.join()
+		self._thread = None
+
+
+def fake_load_from_opts(opts, **load_kws):
+	'Returns FakePulseLoad (with new FakePulseServer) for command-line options.'
+	kws = dict( sinks=opts.sinks, streams=opts.streams, streams_max=opts.streams_max,
+		rate_new=opts.rate_new, rate_change=opts.rate_change,
+		rate_remove=opts.rate_remove, rate_props=opts.rate_props,
+		apps=opts.apps, props=opts.props, seed=opts.seed )
+	kws.update(load_kws)
+	return FakePulseLoad(FakePulseServer(rtt=opts.rtt / 1000.0), **kws)
+
+
+class BenchStats(mk3.PAMixerStats):
+	'''PAMixerStats that also counts pulse requests, memory allocations
+			and python function calls for each phase, when tracing is enabled.
+		Phases must not be nested for allocation/call counters to be correct.'''
+
+	def __init__(self, server, trace=False):
+		super(BenchStats, self).__init__()
+		self.server, self.trace = server, trace
+		self.pulse_calls, self.alloc, self.py_calls = Counter(), Counter(), Counter()
+
+	@contextmanager
+	def phase(self, name):
+		if not self.trace:
+			calls = sum(self.server.calls.values())
+			with super(BenchStats, self).phase(name): yield
+			self.pulse_calls[name] += sum(self.server.calls.values()) - calls
+			return
+		py_calls = [0]
+		def profile_func(frame, ev, arg):
+			if ev == 'call' or ev == 'c_call': py_calls[0] += 1
+		mem = tracemalloc.get_traced_memory()[0]
+		tracemalloc.reset_peak()
+		sys.setprofile(profile_func)
+		try: yield
+		finally:
+			sys.setprofile(None)
+			self.alloc[name] += tracemalloc.get_traced_memory()[1] - mem
+			self.py_calls[name] += py_calls[0]
+			self.counts[name] += 1
+
+def bench_menu(load, conf, trace=False):
+	'Returns PAMixerMenu with BenchStats, connected to fake server in the same way as main() does.'
+	pulse = FakePulse(load.server, 'pa-mixer-mk3-bench')
+	stats = BenchStats(load.server, trace=trace)
+	menu = mk3.PAMixerMenu(pulse, conf, fatal=True, stats=stats)
+	pulse.event_mask_set('sink', 'sink_input')
+	pulse.event_callback_set(lambda ev:
+		menu.update_wakeup_handler(mk3.PAMixerEvent.from_pulsectl_ev(ev)) )
+	return menu
+
+def bench_menu_update(menu, load, action=None, count=0):
+	'''Runs specified number of load-generator actions,
+			queues all resulting events, and runs one PAMixerMenu.update() on these.
+		Returns BenchStats for that update() call.'''
+	for n in range(count): load.step(action)
+	menu.pulse.event_listen(timeout=0) # queue all pending events
+	stats = menu.stats = BenchStats(load.server, trace=menu.stats.trace)
+	if not stats.trace:
+		with stats.phase('total'): menu.update()
+	else: # phases can't be nested here, so total is a sum of these
+		tracemalloc.start()
+		try: menu.update()
+		finally: tracemalloc.stop()
+		for k in stats.alloc, stats.py_calls: k['total'] = sum(k.values())
+		stats.counts['total'] = 1
+	return stats
+
+update_phases = 'fetch items params index names'.split() # order for output
+
+def run_update_bench(opts, conf):
+	'''Benchmarks PAMixerMenu.update() phases with different
+		number of streams (items), for initial listing and for different event batches.'''
+	scenarios = [('full', None, 0)] + list( (action, action, opts.events)
+		for action in ['change', 'props', 'new', 'remove'] )
+	results = list()
+	for n_items in opts.items:
+		for trace in False, True:
+			if trace and not opts.trace: continue
+			load = fake_load_from_opts(opts, streams=n_items, streams_max=n_items * 2)
+			load.populate()
+			menu = bench_menu(load, conf, trace=trace)
+			for scenario, action, count in scenarios:
+				stats = bench_menu_update(menu, load, action, count)
+				for phase in sorted(stats.counts, key=lambda k: (
+						k != 'total', update_phases.index(k) if k in update_phases else 99, k )):
+					res = dict( items=n_items, scenario=scenario,
+						events=count, phase=phase, runs=stats.counts[phase] )
+					if not trace:
+						res.update( time_ms=stats.times[phase] * 1000,
+							pulse_calls=stats.pulse_calls[phase] )
+						results.append(res)
+						continue
+					res = next( r for r in results if r['items'] == n_items
+						and r['scenario'] == scenario and r['phase'] == phase )
+					res.update(alloc_kb=stats.alloc[phase] / 1024.0, py_calls=stats.py_calls[phase])
+
+	if opts.json: json.dump(results, sys.stdout, indent=2)
+	else:
+		print( '{:>6s} {:>8s} {:>6s} {:>8s} {:>5s} {:>10s}'
+			' {:>7s} {:>10s} {:>10s}'.format( 'items', 'scenario', 'events', 'phase',
+				'runs', 'time_ms', 'pulse', 'alloc_kb', 'py_calls' ) )
+		for res in results:
+			print(( '{items:>6d} {scenario:>8s} {events:>6d} {phase:>8s} {runs:>5d}'
+				' {time_ms:>10.3f} {pulse_calls:>7d} {alloc_kb:>10} {py_calls:>10}' ).format(**dict(
+					res, alloc_kb='{:.1f}'.format(res['alloc_kb']) if 'alloc_kb' in res else '-',
+					py_calls=res.get('py_calls', '-') )))
+
+
+def rules_generate(n, load, seed=0):
+	'Returns conf.stream_params-like OrderedDict with n generated [stream-*] sections.'
+	rng, rules = random.Random(seed), OrderedDict()
+	app_names = list(name.rsplit(':', 1) for name in load.app_names)
+	for sec_n in range(n):
+		checks = list()
+		for check_n in range(rng.randint(1, 3)):
+			name, binary = rng.choice(app_names)
+			check = rng.choice([
+				('equals', 'application.process.binary', binary),
+				('equals', 'application.process.binary', 'bin-{}'.format(rng.randrange(n))),
+				('equals', 'application.process.id', str(1000 + rng.randrange(load.apps * 2))),
+				('match', 'application.name', r'^{}( \d+)?$'.format(re.escape(name))),
+				('match', 'application.name', r'^App{}\b'.format(rng.randrange(n))),
+				('match', 'media.name', r'Track {}\b'.format(rng.randrange(50))),
+				('match', 'fake.prop.{}'.format(rng.randrange(load.props)), r'-{}-'.format(rng.randrange(20))),
+				('match', 'x.missing.{}'.format(rng.randrange(5)), r'^$') ])
+			if check[0] == 'match': check = check[:2] + (re.compile(check[2]),)
+			checks.append(check)
+		checks.append(('set', 'volume-max', '0.5'))
+		rules['stream-bench-{}'.format(sec_n)] = checks
+	return rules
+
+def rules_match_linear(stream_params, proplist):
+	'''Same linear scan over all sections/checks as pa-mixer-mk3 used before PAMixerRuleMatcher,
+		with "equals" checks pre-compiled into regexps, as was done on config loading.'''
+	secs = list()
+	for sec, checks in stream_params.items():
+		match = True
+		for t, k, v in checks:
+			if t == 'match' and not v.search(proplist.get(k, '')):
+				match = False
+				break
+		if match: secs.append(sec)
+	return secs
+
+def run_rules_bench(opts):
+	'Compares PAMixerRuleMatcher against linear scan over all rule sections.'
+	load = fake_load_from_opts(opts, sinks=0, streams=opts.items)
+	load.populate()
+	proplists = list(obj.proplist for obj in load.server.objs['sink_input'].values())
+	print('{:>8s} {:>6s} {:>8s} {:>12s} {:>12s} {:>8s}'.format(
+		'sections', 'items', 'matches', 'linear_ms', 'compiled_ms', 'speedup' ))
+	for n in opts.sections:
+		rules = rules_generate(n, load, seed=opts.seed)
+		rules_linear = OrderedDict(
+			(sec, list( (('match', k, re.compile(r'^{}$'.format(re.escape(v))))
+				if t == 'equals' else (t, k, v)) for t, k, v in checks )) for sec, checks in rules.items() )
+		ts = time.perf_counter()
+		res_linear = list(rules_match_linear(rules_linear, props) for props in proplists)
+		ts_linear = time.perf_counter() - ts
+
+		ts = time.perf_counter()
+		matcher = mk3.PAMixerRuleMatcher(rules)
+		ts_compile = time.perf_counter() - ts
+		ts = time.perf_counter()
+		res = list(list(map(op.itemgetter(0), matcher.match(props))) for props in proplists)
+		ts_matcher = time.perf_counter() - ts
+		if res != res_linear: raise AssertionError('Matcher results differ from linear scan')
+
+		log.debug('Rules (n={}) compile time: {:.3f}ms', n, ts_compile * 1000)
+		print('{:>8d} {:>6d} {:>8d} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+			n, len(proplists), sum(map(len, res)), ts_linear * 1000,
+			ts_matcher * 1000, ts_linear / max(ts_matcher, 1e-9) ))
+
+
+def run_ui(opts, mixer_args):
+	'Runs normal pa-mixer-mk3 main() with curses ui, but against fake pulse server.'
+	load = fake_load_from_opts(opts)
+	load.populate()
+	mk3.Pulse = ft.partial(FakePulse, load.server)
+	mk3.PulseAsync = ft.partial(FakePulseAsync, load.server)
+	load.start()
+	try: return mk3.main(mixer_args)
+	finally: load.stop()
+
+
+def main(args=None):
+	import argparse
+	parser = argparse.ArgumentParser(
+		description='Load-testing and benchmarking tool for pa-mixer-mk3, using fake pulse server.'
+			' Arguments after "--" are passed to pa-mixer-mk3 main(), where it is used.')
+
+	group = parser.add_argument_group('Fake pulse server load parameters')
+	group.add_argument('--sinks', type=int, metavar='n', default=2,
+		help='Number of sinks to create on start (default: %(default)s).')
+	group.add_argument('--streams', type=int, metavar='n', default=10,
+		help='Number of streams (sink-inputs) to create on start (default: %(default)s).')
+	group.add_argument('--streams-max', type=int, metavar='n',
+		help='Max number of streams, "new" events turn into'
+			' "remove" after that (default: 2x of --streams or 10).')
+	for ev, desc in [ ('new', 'creation'), ('change', 'volume change'),
+			('remove', 'removal'), ('props', 'media.name property change') ]:
+		group.add_argument('--rate-{}'.format(ev), type=float, metavar='n/s', default=0,
+			help='Average rate of stream {} events per second (default: %(default)s).'.format(desc))
+	group.add_argument('--apps', type=int, metavar='n', default=20,
+		help='Number of distinct applications that streams belong to (default: %(default)s).')
+	group.add_argument('--props', type=int, metavar='n', default=50,
+		help='Number of properties in each stream proplist (default: %(default)s).')
+	group.add_argument('--seed', type=int, metavar='n', default=0,
+		help='Random seed for generated objects and events (default: %(default)s).')
+	group.add_argument('--rtt', type=float, metavar='ms', default=0,
+		help='Simulated round-trip delay for every pulse request, in ms (default: %(default)s).')
+
+	parser.add_argument('--debug', action='store_true', help='Verbose operation mode.')
+
+	cmds = parser.add_subparsers(title='Commands', dest='call')
+
+	cmd = cmds.add_parser('ui',
+		help='Run pa-mixer-mk3 curses ui against fake pulse server with generated load.')
+
+	cmd = cmds.add_parser('update',
+		help='Benchmark PAMixerMenu.update() phases with different number of items.'
+			' Runs initial full update, then updates for batches of'
+				' change/props/new/remove events, reporting stats for each phase.'
+			' Only --sinks, --apps, --props, --seed and --rtt load parameters are used.')
+	cmd.add_argument('-n', '--items', type=int, metavar='n',
+		nargs='+', default=[10, 100, 1000, 10000],
+		help='Number of streams to run benchmark with (default: %(default)s).')
+	cmd.add_argument('-e', '--events', type=int, metavar='n', default=100,
+		help='Number of events to process in each batch-update run (default: %(default)s).')
+	cmd.add_argument('-c', '--conf', metavar='path',
+		help='pa-mixer-mk3 config file to use, e.g. with [stream-*] rules to apply to items.')
+	cmd.add_argument('-t', '--trace', action='store_true',
+		help='Do second run with tracemalloc and function-call profiling'
+			' to count allocations (peak bytes per phase) and python calls (slow).')
+	cmd.add_argument('-j', '--json', action='store_true',
+		help='Output results as JSON list, for storing and comparing between versions.')
+
+	cmd = cmds.add_parser('rules',
+		help='Micro-benchmark for matching [stream-*] config rules'
+			' to stream properties, comparing compiled matcher to linear scan.'
+			' Only --apps, --props and --seed load parameters are used.')
+	cmd.add_argument('-n', '--sections', type=int, metavar='n',
+		nargs='+', default=[10, 100, 1000],
+		help='Number of generated rule sections to run benchmark with (default: %(default)s).')
+	cmd.add_argument('-i', '--items', type=int, metavar='n', default=1000,
+		help='Number of generated stream proplists to match (default: %(default)s).')
+
+	args = sys.argv[1:] if args is None else args
+	try: n = args.index('--')
+	except ValueError: mixer_args = list()
+	else: args, mixer_args = args[:n], args[n+1:]
+	opts = parser.parse_args(args)
+
+	global log
+	if opts.call != 'ui': # pa-mixer-mk3 main() sets up logging for that one
+		logging.basicConfig(
+			level=logging.DEBUG if opts.debug else logging.WARNING,
+			format='%(asctime)s :: %(threadName)s %(levelname)s :: %(message)s',
+			datefmt='%Y-%m-%d %H:%M:%S' )
+	log = get_logger('main')
+
+	if opts.call == 'ui': return run_ui(opts, mixer_args)
+	elif opts.call == 'update':
+		conf = mk3.Conf()
+		conf.dump_stream_params = False
+		if opts.conf: mk3.update_conf_from_file(conf, opts.conf)
+		return run_update_bench(opts, conf)
+	elif opts.call == 'rules': return run_rules_bench(opts)
+	else: parser.error('Action not specified')
+
+if __name__ == '__main__': sys.exit(main())
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
 import itertools as it, operator as op, functools as ft
-from collections import OrderedDict, defaultdict, deque
-from contextlib import contextmanager
-import os, sys, re, time, logging, configparser
-import base64, hashlib, unicodedata
-import signal, threading
+from collections import OrderedDict, defaultdict, deque, Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, CancelledError
+import os, sys, re, time, string, logging, configparser
+import unicodedata, bisect, heapq
+import signal, select, threading, asyncio
 
 from pulsectl import Pulse, PulseLoopStop, PulseDisconnected, PulseIndexError
 
+PulseAsync = None # pulsectl_asyncio.PulseAsync, only imported for "asyncio" engine
+
 
 class LogMessage(object):
 	def __init__(self, fmt, a, k): self.fmt, self.a, self.k = fmt, a, k
@@ -36,15 +39,6 @@ class LogPrefixAdapter(LogStyleAdapter):
 get_logger = lambda name: LogStyleAdapter(logging.getLogger(name))
 
 
-def uid_str( seed=None, length=4,
-		_seed_gen=it.chain.from_iterable(map(range, it.repeat(2**30))) ):
-	seed_bytes = length * 6 // 8
-	assert seed_bytes * 8 // 6 == length, [length, seed_bytes]
-	if seed is None: seed = '\0\0\0{:08x}'.format(next(_seed_gen))
-	seed = hashlib.sha256(bytes(seed, encoding='utf-8')).digest()[:seed_bytes]
-	return base64.urlsafe_b64encode(seed).decode()
-
-
 class Conf(object):
 	def __repr__(self): return repr(vars(self))
 
@@ -58,9 +52,20 @@ class Conf(object):
 	placeholder_media_names = 'audio stream', 'AudioStream', 'Output', 'ALSA Playback'
 	name_len_max = 100
 	name_cut_from = 'left' # "left" or "right"
+	# {name} is replaced by descriptive name, other {...} fields by proplist values
+	stream_name_format = '{name} ({application.process.user}@{application.process.host}:{application.process.id})'
+	sink_name_format = '{name} ({device.profile.name}@{alsa.driver_name})'
 	name_show_level = True
 
 	overkill_redraw = False # if terminal gets resized often, might cause noticeable flickering
+	# "direct" - send every drawn frame to terminal right away, "pad" - draw into off-screen pad,
+	#  copying changes from it to terminal at most output_fps_max times per second (0 - no limit),
+	#  e.g. for slow ssh links, where every intermediate volume bar state is a waste of bandwidth
+	output_mode = 'direct'
+	output_fps_max = 10.0
+	# Max redraws per second for pulse updates, coalescing events in-between, 0 - no limit.
+	# Keypresses are always handled and redrawn right away, not affected by this limit.
+	redraw_fps_max = 25.0
 	verbose = False
 	reconnect = True
 
@@ -70,6 +75,31 @@ class Conf(object):
 	focus_new_items = True
 	focus_new_items_delay = 5.0 # min seconds since last focus change to trigger this
 
+	# Number of changed objects in one batch of events to fetch full lists for, instead
+	#  of querying these one-by-one, 0 - disable, "adaptive" option can pick it for less as well
+	update_resync_threshold = 50
+	update_resync_adaptive = True # pick full list if it's estimated to be faster from request times
+
+	# Clamp volume to volume-min/volume-max from matched [stream-*] sections on every change,
+	#  not just when stream appears, ignoring differences within "hysteresis" value (0-1 range),
+	#  and giving up after "burst" corrections within "interval" seconds (for apps that fight back)
+	volume_limits_enforce = False
+	volume_limits_hysteresis = 0.01
+	volume_limits_burst = 5
+	volume_limits_interval = 10.0
+
+	# Min seconds between volume/mute updates sent to pulse, with only latest value sent after that,
+	#  to avoid blocking on every one of these, e.g. with held-down key, 0 - send all right away
+	volume_write_interval = 0.05
+
+	# "threads" - pulse i/o thread, waking up blocking curses loop via signals,
+	#  "asyncio" - single event loop for everything, requires pulsectl_asyncio module
+	engine = 'threads'
+
+	# Use separate pulse connection for events with "threads" engine, so that requests
+	#  don't have to interrupt event_listen() and can run in parallel with event delivery
+	events_connection = False
+
 	@staticmethod
 	def parse_bool(val, _states={
 			'1': True, 'yes': True, 'true': True, 'on': True,
@@ -104,13 +134,41 @@ def update_conf_from_file(conf, path_or_file):
 		for k, v in config.items(sec):
 			match = re.search(r'^(match|equals)\[(.*)\]$', k)
 			if match:
-				v = re.compile(r'^{}$'.format(re.escape(v)) if match.group(1) == 'equals' else v)
-				params.append(('match', match.group(2), v))
+				if match.group(1) == 'match': v = re.compile(v)
+				params.append((match.group(1), match.group(2), v))
 			else: params.append(('set', k, v))
 		conf.stream_params[sec] = params
 
 
 class PAMixerReconnect(Exception): pass
+class PAMixerInvalidAction(Exception): pass
+
+class PAMixerStats(object):
+	'''Run counts and timings for named code phases, for debug logging and benchmarks.
+		"gauges" are callables, returning values to include in str() output.'''
+
+	def __init__(self): self.counts, self.times, self.gauges = Counter(), Counter(), dict()
+
+	def __str__(self):
+		return ' '.join(it.chain(
+			( '{}={}/{:.3f}s'.format(k, self.counts[k], self.times[k])
+				if k in self.times else '{}={}'.format(k, self.counts[k]) for k in sorted(self.counts) ),
+			('{}=[{}]'.format(k, self.gauges[k]()) for k in sorted(self.gauges)) ))
+
+	@contextmanager
+	def phase(self, name):
+		ts = time.perf_counter()
+		try: yield
+		finally:
+			self.times[name] += time.perf_counter() - ts
+			self.counts[name] += 1
+
+	def count(self, name, n=1): self.counts[name] += n
+
+	def add(self, name, seconds):
+		'Same as running phase(name) that took specified number of seconds.'
+		self.times[name] += seconds
+		self.counts[name] += 1
 
 class PAMixerEvent(object):
 	__slots__ = 'obj_type obj_index t'.split()
@@ -126,11 +184,56 @@ class PAMixerEvent(object):
 
 class PAMixerMenuItem(object):
 
+	# Proplist keys that are used for base name in _get_name_descriptive() for each item type
+	name_props = dict(
+		stream=['media.name', 'application.name'],
+		sink=['alsa.id', 'device.description', 'device.api', 'device.string'] )
+
+	# Proplist keys used in item.ident in addition to object name, for each item type
+	ident_props = dict(stream=[ 'application.process.binary',
+		'application.process.id', 'application.process.host' ])
+
+	@staticmethod
+	def name_format_compile(fmt):
+		'''Returns (positional_fmt, keys) tuple for name format/template string,
+				with {name} field mapped to first positional argument and all other fields to
+				values for returned keys, so that it can be used as "fmt.format(name, *values)".
+			Proplist keys have dots in them, hence this conversion.'''
+		fmt_pos, keys = list(), list()
+		for text, k, spec, conv in string.Formatter().parse(fmt or '{name}'):
+			fmt_pos.append(text.replace('{', '{{').replace('}', '}}'))
+			if k is None: continue
+			if k == 'name': n = 0
+			else:
+				if k not in keys: keys.append(k)
+				n = keys.index(k) + 1
+			fmt_pos.append('{{{}{}{}}}'.format(n, '!' + conv if conv else '', ':' + spec if spec else ''))
+		return ''.join(fmt_pos), tuple(keys)
+
+	@classmethod
+	def name_formats_compile(cls, conf):
+		'''Returns {item_type: (positional_fmt, fmt_keys, name_keys)} for name formats in conf,
+			where name_keys are all proplist keys that item name can be generated from.'''
+		formats = dict()
+		for t, props in cls.name_props.items():
+			fmt, keys = cls.name_format_compile(getattr(conf, '{}_name_format'.format(t)))
+			formats[t] = fmt, keys, tuple(props) + tuple(k for k in keys if k not in props)
+		return formats
+
 	def __init__(self, menu, obj_t, obj_id, obj):
 		self.menu, self.conf = menu, menu.conf
 		self.t, self.uid = obj_t, obj_id
 		self.hidden = self.name_custom = False
+		self.rules_matched = set() # config section numbers, set by menu
+		self.volume_limits, self.volume_limits_fixes = None, (0, 0) # (min, max), (ts, count)
+		self.state = dict() # optimistic volume/mute values - {k: [value, write_done_ts]}
+		self.name_fmt, self.name_fmt_keys, self.name_keys =\
+			menu.item_name_formats.get(obj_t, (None, (), ()))
+		self.name_fingerprint = None
+		self.index_key = None # set by PAMixerItemIndex
 		self.created_ts = time.monotonic()
+		# Identity that, unlike uid, stays same across reconnects and server restarts
+		self.ident = (obj_t, obj.name) + tuple(map(obj.proplist.get, self.ident_props.get(obj_t, ())))
 		self.update(obj)
 
 		if self.conf.dump_stream_params:
@@ -143,15 +246,27 @@ class PAMixerMenuItem(object):
 		return '<{}[{:x}] {}[{}]: {}>'.format(
 			self.__class__.__name__, id(self), self.t, self.uid, self.name )
 
-	def update(self, obj=None):
+	def update(self, obj=None, obj_ts=None):
+		'Updates pulse object, with obj_ts being time.monotonic() before it was fetched, if known.'
 		if obj: self.obj = obj
-		if not self.name_custom: self.name_update()
+		if self.state and obj_ts: self.state_reconcile(obj_ts)
+		if self.name_custom: return
+		# Name only depends on few props, and these rarely change, unlike e.g. volume
+		name_fp = self.obj.name, tuple(map(self.obj.proplist.get, self.name_keys))
+		if name_fp == self.name_fingerprint: return
+		self.name_fingerprint = name_fp
+		self.name_update()
 
 	def name_update(self, name=None):
 		if not name: name = self._get_name() or 'knob'
 		else: self.name_custom = True
 		self.name_base = self.name = name
 
+	def name_reset(self):
+		'Drops custom name, if any, to use one generated from proplist again.'
+		self.name_custom, self.name_fingerprint = False, None
+		self.update()
+
 	def _get_name(self):
 		try: return self._get_name_descriptive()
 		except Exception as err:
@@ -161,9 +276,9 @@ class PAMixerMenuItem(object):
 
 	def _get_name_descriptive(self):
 		'Can probably fail with KeyError if something is really wrong with stream/device props.'
-		ext, props = None, dict(
-			(k, self._strip_noise_bytes(v, self.conf.broken_chars_replace))
-			for k, v in self.obj.proplist.items() )
+		props, proplist = dict(), self.obj.proplist
+		for k in self.name_keys:
+			if k in proplist: props[k] = self._strip_noise_bytes(proplist[k], self.conf.broken_chars_replace)
 
 		if self.t == 'stream':
 			if self.conf.use_media_name:
@@ -171,63 +286,74 @@ class PAMixerMenuItem(object):
 				if name and name not in self.conf.placeholder_media_names: return name
 			try: name = props['application.name']
 			except KeyError: name = props['media.name'] # some synthetic stream with non-descriptive name
-			ext = '({application.process.user}@'\
-				'{application.process.host}:{application.process.id})'
 
 		elif self.t == 'sink':
-			if self.conf.use_device_name: name = self.obj.name
-			else:
-				name = props.get('alsa.id')\
-					or props.get('device.description') or props.get('device.api')
-				if not name:
-					try: name = '{}.{}'.format(props['device.api'], props['device.string'])
-					except KeyError: name = props['device.description']
-				ext = '({device.profile.name}@{alsa.driver_name})'
+			if self.conf.use_device_name: return self.obj.name
+			name = props.get('alsa.id')\
+				or props.get('device.description') or props.get('device.api')
+			if not name:
+				try: name = '{}.{}'.format(props['device.api'], props['device.string'])
+				except KeyError: name = props['device.description']
 
 		else: raise KeyError('Unknown menu-item type (for naming): {}'.format(self.t))
 
-		if ext:
-			try:
-				name = '{} {}'.format( name,
-					re.sub(r'\{([^}]+)\}', r'{}', ext).format(
-						*op.itemgetter(*re.findall(r'\{([^}]+)\}', ext))(props) ) )
-			except KeyError as err:
-				log.debug( 'Unable to get extended descriptive name'
-					' (type: {!r}, uid: {}) due to missing key: {}', self.t, self.uid, err )
+		try: return self.name_fmt.format(name, *map(props.__getitem__, self.name_fmt_keys))
+		except KeyError as err:
+			log.debug( 'Unable to get extended descriptive name'
+				' (type: {!r}, uid: {}) due to missing key: {}', self.t, self.uid, err )
 		return name
 
 	def _strip_noise_bytes(self, obj, replace='_'):
 		'''Make sure there arent any random weird chars that dont belong to any alphabet.
-			Only ascii non-letters are allowed, as fancy symbols don't seem to work well with curses.'''
+			Only ascii non-letters are allowed, as fancy symbols don't seem to work well with curses.
+			Results are cached, as same values tend to repeat a lot between streams and updates.'''
 		if not isinstance(obj, str): obj = str(obj)
-		obj_ucs = list()
+		return self._strip_noise_str(obj, replace)
+
+	_strip_noise_chars = dict() # char -> True/False verdict, filled as chars are encountered
+
+	@staticmethod
+	@ft.lru_cache(maxsize=8192)
+	def _strip_noise_str(obj, replace):
+		obj_ucs, chars = list(), PAMixerMenuItem._strip_noise_chars
 		for uc in obj:
-			try:
-				unicodedata.name(uc)
-				if unicodedata.category(uc) != 'Ll': uc.encode('ascii')
-			except (ValueError, UnicodeEncodeError):
-				if replace: obj_ucs.append(replace)
-			else: obj_ucs.append(uc)
+			uc_ok = chars.get(uc)
+			if uc_ok is None:
+				try:
+					unicodedata.name(uc)
+					if unicodedata.category(uc) != 'Ll': uc.encode('ascii')
+				except (ValueError, UnicodeEncodeError): uc_ok = False
+				else: uc_ok = True
+				chars[uc] = uc_ok
+			if uc_ok: obj_ucs.append(uc)
+			elif replace: obj_ucs.append(replace)
 		return ''.join(obj_ucs)
 
+	@classmethod
+	def strip_noise_stats(cls):
+		info = cls._strip_noise_str.cache_info()
+		return 'hits={:.1%} size={} chars={}'.format(
+			info.hits / max(1, info.hits + info.misses), info.currsize, len(cls._strip_noise_chars) )
+
 	@property
 	def muted(self):
-		return bool(self.obj.mute)
+		state = self.state.get('mute')
+		return state[0] if state else bool(self.obj.mute)
 	@muted.setter
 	def muted(self, val):
-		self.obj.mute = int(val)
-		with self.menu.update_wakeup() as pulse: pulse.mute(self.obj, self.obj.mute)
+		if bool(val) != self.muted: self.state_set('mute', bool(val))
 
 	@property
 	def volume(self):
-		'Volume as one float in 0-1 range.'
+		'Volume as one float in 0-1 range, including value that pulse might not have yet.'
+		state = self.state.get('volume')
+		if state: return state[0]
 		return min(1.0, max(0,
 			self.obj.volume.value_flat - self.conf.min_volume ) / float(self.conf.max_volume))
 	@volume.setter
 	def volume(self, val):
-		val_pulse = min(1.0, max(0, val)) * self.conf.max_volume + self.conf.min_volume
-		log.debug('Setting volume: {} (pulse: {}) for {}', val, val_pulse, self)
-		with self.menu.update_wakeup() as pulse: pulse.volume_set_all_chans(self.obj, val_pulse)
+		val = min(1.0, max(0, val))
+		if val != self.volume: self.state_set('volume', val) # e.g. already at 100%
 
 	@property
 	def port(self):
@@ -235,11 +361,49 @@ class PAMixerMenuItem(object):
 		return self.obj.port_active
 	@port.setter
 	def port(self, name):
+		self.port_check(name)
+		async def port_set(pulse): await pulse.port_set(self.obj, name)
+		self.menu.io.submit(port_set, trap_errors=True)
+
+	def state_set(self, k, value):
+		'''Sets optimistic volume/mute value, to use it until pulse object is updated
+			with the state after it was sent there, and queues it to be sent.'''
+		self.state[k] = [value, None]
+		self.menu.writes.set(self, k, value)
+
+	def state_done(self, k, value, err=None):
+		'Called after value for k was sent to pulse, dropping it if it failed.'
+		state = self.state.get(k)
+		if not state or state[0] != value: return # newer one was set since
+		if not err: state[1] = time.monotonic()
+		else:
+			log.debug('Rolling back {} value for {!r} after error: {}', k, self, err)
+			self.state.pop(k, None)
+
+	def state_reconcile(self, obj_ts):
+		'Drops optimistic values that were sent to pulse before current object was fetched.'
+		for k, (value, ts_done) in list(self.state.items()):
+			if ts_done and ts_done <= obj_ts: self.state.pop(k, None)
+
+	def volume_pulse(self, val):
+		'Returns pulse volume value for 0-1 float volume.'
+		return min(1.0, max(0, val)) * self.conf.max_volume + self.conf.min_volume
+
+	def port_check(self, name):
+		'Raises PAMixerInvalidAction if port cannot be set to specified one.'
 		if self.t != 'sink':
-			log.warning( 'Setting ports is only'
-				' available for {!r}-type streams, not {!r}-type', 'sink', self.t )
-		with self.menu.update_wakeup() as pulse: pulse.port_set(self.obj, name)
+			raise PAMixerInvalidAction( 'Setting ports is only'
+				' available for {!r}-type streams, not {!r}-type'.format('sink', self.t) )
+		ports = list(port.name for port in self.obj.port_list)
+		if name not in ports:
+			raise PAMixerInvalidAction('No such port: {!r} (available: {})'.format(name, ', '.join(ports)))
+
 
+	def obj_changed(self, obj):
+		'Returns True if specified pulse object state differs from the current one.'
+		port_name = lambda obj: getattr(getattr(obj, 'port_active', None), 'name', None)
+		return obj.mute != self.obj.mute or obj.volume.values != self.obj.volume.values\
+			or port_name(obj) != port_name(self.obj) or obj.proplist != self.obj.proplist
 
 	def muted_toggle(self): self.muted = not self.muted
 	def volume_change(self, delta):
@@ -250,85 +414,757 @@ class PAMixerMenuItem(object):
 	def get_prev(self): return self.menu.item_before(self)
 
 
+class PAMixerItemIndex(object):
+	'''Ordered sequence of visible menu items - sinks first, then streams,
+			both in order of addition, maintained incrementally as items get added/removed.
+		Items are kept sorted by order-key assigned on first addition, so that
+			insert/remove are O(log n) bisect ops (+ fast list memmove),
+			while item/uid lookups, membership checks and len() are O(1).
+		uid -> position mapping is cached for O(1) position lookups,
+			kept up-to-date on append/pop-from-end, and rebuilt lazily after other changes.
+		Newest item (by created_ts) is tracked via max-heap with lazy removal.
+		Counts of display name lengths are kept for name_len_max(),
+			updated on add/remove and via name_update() after renames.'''
+
+	def __init__(self):
+		self._keys, self._items, self._uids = list(), list(), dict()
+		self._key_seq, self._pos = it.count(), dict()
+		self._newest, self._newest_seq = list(), it.count()
+		self._name_lens, self._name_len_counts = dict(), Counter()
+
+	def __len__(self): return len(self._items)
+	def __iter__(self): return iter(self._items)
+	def __getitem__(self, k): return self._items[k]
+	def __contains__(self, item): return item is not None and self._uids.get(item.uid) is item
+	def __repr__(self): return '<{} {}>'.format(self.__class__.__name__, self._items)
+
+	def get(self, uid): return self._uids.get(uid)
+
+	def position(self, item):
+		'Returns position of item with same uid as specified one or None, if there is no such item.'
+		if self._pos is None:
+			self._pos = dict((item.uid, n) for n, item in enumerate(self._items))
+		return self._pos.get(item.uid)
+
+	def index(self, item):
+		if item not in self: raise ValueError(item)
+		return self.position(item)
+
+	def newest(self):
+		'Returns visible item with highest created_ts value or None.'
+		heap = self._newest
+		while heap and heap[0][2] not in self: heapq.heappop(heap)
+		return heap[0][2] if heap else None
+
+	def add(self, item):
+		if item in self: return
+		if item.uid in self._uids: self.remove(self._uids[item.uid])
+		if not item.index_key: item.index_key = item.t != 'sink', next(self._key_seq)
+		n = bisect.bisect_left(self._keys, item.index_key)
+		if self._pos is not None:
+			if n == len(self._items): self._pos[item.uid] = n
+			else: self._pos = None
+		self._keys.insert(n, item.index_key)
+		self._items.insert(n, item)
+		self._uids[item.uid] = item
+		heap = self._newest
+		if len(heap) > 2 * len(self._items) + 16: # drop removed items
+			heap[:] = list(entry for entry in heap if entry[2] in self)
+			heapq.heapify(heap)
+		heapq.heappush(heap, (-item.created_ts, -next(self._newest_seq), item))
+		self._name_len_set(item, len(item.name))
+
+	def remove(self, item):
+		if item not in self: return
+		n = bisect.bisect_left(self._keys, item.index_key)
+		if self._pos is not None:
+			if n == len(self._items) - 1: del self._pos[item.uid]
+			else: self._pos = None
+		del self._keys[n], self._items[n], self._uids[item.uid]
+		self._name_len_set(item, None)
+
+	def update(self, item):
+		'Adds or removes item, depending on whether it is hidden or not.'
+		if item.hidden: self.remove(item)
+		else: self.add(item)
+
+	def _name_len_set(self, item, n):
+		counts, n_old = self._name_len_counts, self._name_lens.pop(item.uid, None)
+		if n_old is not None:
+			counts[n_old] -= 1
+			if not counts[n_old]: del counts[n_old]
+		if n is not None: self._name_lens[item.uid], counts[n] = n, counts[n] + 1
+
+	def name_update(self, item):
+		'Updates name length stats for renamed item, if it is in the index.'
+		if item in self: self._name_len_set(item, len(item.name))
+
+	def name_len_max(self):
+		'Returns length of longest display name among items, in O(number of distinct lengths).'
+		return max(self._name_len_counts, default=0)
+
+
+class PAMixerNameRegistry(object):
+	'''Keeps display names of menu items unique by appending " #N" suffixes to duplicates.
+		Suffix numbers are allocated per base name (lowest unused one, no suffix for 1),
+			stick to item uid until it is released (item removed) or renamed,
+			and can be shared between menu instances to keep them same across reconnects.
+		Released numbers are remembered for item.ident (unlike uid, not based on pulse index)
+			and given back to items with same ident and base name while still unused,
+			e.g. when all objects get new indexes after pulse server restart.'''
+
+	released_max = 500 # max number of remembered (name_base, ident) entries for released numbers
+
+	def __init__(self):
+		self._uids = dict() # uid -> (name_base, n, ident)
+		self._names = dict() # name_base -> [next_n, released_n_heap, count]
+		self._released = OrderedDict() # (name_base, ident) -> [n, ...]
+
+	def update(self, *items):
+		'''Registers new or renamed items and sets their display names.
+			Items that can get previously released numbers back are registered first.'''
+		if len(items) > 1 and self._released:
+			items = sorted(items, key=lambda item: item.uid in self._uids
+				or (item.name_base, item.ident) not in self._released)
+		for item in items:
+			reg = self._uids.get(item.uid)
+			if reg and (reg[0] != item.name_base or reg[2] != item.ident): reg = self.release(item.uid)
+			if not reg:
+				name_n = self._names.get(item.name_base)
+				if not name_n: name_n = self._names[item.name_base] = [1, list(), 0]
+				n = self._reclaim(name_n, (item.name_base, item.ident))
+				if n is None:
+					if name_n[1]: n = heapq.heappop(name_n[1])
+					else: n, name_n[0] = name_n[0], name_n[0] + 1
+				name_n[2] += 1
+				reg = self._uids[item.uid] = item.name_base, n, item.ident
+			item.name = item.name_base if reg[1] == 1 else '{} #{}'.format(*reg)
+
+	def _reclaim(self, name_n, key):
+		'Returns lowest unused number released for key, marked as used, or None.'
+		ns = self._released.pop(key, None)
+		if not ns: return
+		next_n, heap = name_n[0], name_n[1]
+		for n in sorted(ns):
+			if n >= next_n:
+				heap.extend(range(next_n, n))
+				name_n[0] = n + 1
+			elif n in heap: heap.remove(n)
+			else: continue # taken by other item since release
+			heapq.heapify(heap)
+			ns.remove(n)
+			if ns: self._released[key] = ns
+			return n
+
+	def release(self, uid):
+		reg = self._uids.pop(uid, None)
+		if not reg: return
+		name_base, n, ident = reg
+		name_n = self._names[name_base]
+		name_n[2] -= 1
+		if not name_n[2]: del self._names[name_base]
+		else: heapq.heappush(name_n[1], n)
+		ns = self._released.pop((name_base, ident), list())
+		ns.append(n)
+		self._released[name_base, ident] = ns
+		if len(self._released) > self.released_max: self._released.popitem(last=False)
+
+	def retain(self, uids):
+		'Releases names of all items with uids that are not in the specified set/dict.'
+		for uid in set(self._uids).difference(uids): self.release(uid)
+
+
+class PAMixerPulseSync(object):
+	'''Wrapper for blocking pulsectl.Pulse, with methods returning awaitables for the result,
+			so that same coroutines can be used with it and with pulsectl_asyncio.PulseAsync.
+		Such coroutines never actually suspend, and are run to completion via run().'''
+
+	class Result(object):
+		__slots__ = 'value',
+		def __init__(self, value): self.value = value
+		def __await__(self):
+			return self.value
+			yield # makes it a generator
+
+	def __init__(self, pulse): self.pulse = pulse
+
+	def __getattr__(self, k):
+		func = getattr(self.pulse, k)
+		return lambda *args, **kws: self.Result(func(*args, **kws))
+
+	@staticmethod
+	def run(coro):
+		try: coro.send(None)
+		except StopIteration as stop: return stop.value
+		coro.close()
+		raise RuntimeError('Coroutine got suspended when using blocking pulse client: {!r}'.format(coro))
+
+
+class PAMixerPulseIO(object):
+	'''Runs all pulse requests in one thread that owns the connection -
+			commands are queued via submit(), which returns Future for the result right away,
+			and are run in that order between event_listen() calls, interrupted to do that.
+		Commands are coroutine functions, which are run with PAMixerPulseSync wrapper here.
+		If that thread is not running (e.g. in benchmarks), commands are run in the calling thread.
+		call_later() timers are also run from that thread, with event_listen() timeout
+			or wait for commands set to the nearest deadline, instead of starting a thread for each.
+		event_listen() is interrupted via wakeup pipe, which is polled together with pulse
+			connection (via Pulse.set_poll_func), as event_listen_stop() does nothing if
+			called right before event_listen() starts, and can't be relied upon for that.
+		With separate pulse_events connection, events are received from listen() in another thread,
+			and command thread only waits for queued commands, without interrupting event_listen().'''
+
+	listen_timeout = 0.5 # for listen() to stop, in case event_listen_stop() is called before it starts
+
+	class Timer(object):
+		__slots__ = 'func',
+		def __init__(self, func): self.func = func
+		def cancel(self): self.func = None
+
+	def __init__(self, pulse, stats, pulse_events=None):
+		self.pulse, self.stats, self.pulse_sync = pulse, stats, PAMixerPulseSync(pulse)
+		self.pulse_events = pulse_events if pulse_events is not pulse else None
+		self.thread, self._queue, self._stop = None, deque(), False
+		self._queue_cond, self._wakeup_fds = threading.Condition(), None
+		self._timers, self._timer_seq = list(), it.count() # heap of (deadline, n, timer)
+
+	def submit(self, func, *args, trap_errors=False, **kws):
+		'''Queues "await func(pulse, *args, **kws)" call, returning concurrent.futures.Future for its result.
+			trap_errors=True logs any exceptions instead, with None set as a result.'''
+		fut = Future()
+		if trap_errors: func = ft.partial(self._call_trap_errors, func)
+		if self._stop: fut.cancel()
+		elif not self.thread or not self.thread.is_alive(): self._run(fut, func, args, kws)
+		else:
+			self._queue.append((fut, func, args, kws, time.monotonic()))
+			self._wakeup()
+		return fut
+
+	def call_later(self, delay, func):
+		'''Runs func() from serve() thread after delay, returning object with cancel() method.
+			Uses separate timer thread if serve() thread is not running.'''
+		if not self.thread or not self.thread.is_alive():
+			timer = threading.Timer(delay, func)
+			timer.name, timer.daemon = 'pulse-io-timer', True
+			timer.start()
+			return timer
+		timer = self.Timer(func)
+		with self._queue_cond:
+			heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_seq), timer))
+			if self._timers[0][2] is timer: self._wakeup() # to update its timeout
+		return timer
+
+	def _timers_delay(self):
+		'Returns delay until nearest call_later() deadline or None, must be called with _queue_cond lock.'
+		if self._timers: return max(0, self._timers[0][0] - time.monotonic())
+
+	def _timers_run(self):
+		'Runs all call_later() timers that are due, returning delay until next one or None.'
+		while True:
+			with self._queue_cond:
+				delay = self._timers_delay()
+				if delay != 0: return delay
+				timer = heapq.heappop(self._timers)[2]
+			func = timer.func
+			if not func: continue
+			try: func()
+			except Exception as err:
+				log.exception('Pulse i/o timer failure: <{}> {}', err.__class__.__name__, err)
+
+	def serve(self):
+		'''Runs queued commands and listens for pulse events, until stop() is called.
+			Only runs commands with separate pulse_events connection, see listen() for these.'''
+		if not self.pulse_events:
+			fds = os.pipe()
+			for fd in fds: os.set_blocking(fd, False)
+			with self._queue_cond: self._wakeup_fds = fds
+			self.pulse.set_poll_func(self._poll)
+		try:
+			while not self._stop:
+				while self._queue:
+					fut, func, args, kws, ts = self._queue.popleft()
+					self.stats.add('io_queue', time.monotonic() - ts)
+					self._run(fut, func, args, kws)
+				delay = self._timers_run()
+				if self._queue: continue
+				if self.pulse_events:
+					with self._queue_cond:
+						if not (self._queue or self._stop): self._queue_cond.wait(self._timers_delay())
+				else: self.pulse.event_listen(timeout=delay)
+		finally:
+			self._stop = True
+			while self._queue: self._queue.popleft()[0].cancel()
+			with self._queue_cond:
+				self._timers.clear()
+				fds, self._wakeup_fds = self._wakeup_fds, None
+				if fds: list(map(os.close, fds))
+
+	def listen(self):
+		'Listens for pulse events on separate pulse_events connection, until stop() is called.'
+		while not self._stop: self.pulse_events.event_listen(timeout=self.listen_timeout)
+
+	def stop(self):
+		self._stop = True
+		self._wakeup()
+		if self.pulse_events: self.pulse_events.event_listen_stop()
+
+	def _wakeup(self):
+		'Interrupts serve() waiting for commands or in event_listen(), if it is running.'
+		with self._queue_cond:
+			if self.pulse_events: return self._queue_cond.notify()
+			if not self._wakeup_fds: return
+			try: os.write(self._wakeup_fds[1], b'.')
+			except BlockingIOError: pass # already has unread wakeups
+
+	def _poll(self, fds, timeout):
+		'''Poll function for libpulse mainloop in serve() thread, also checking wakeup pipe,
+			stopping event_listen() loop when it has anything, even if it was written before poll.'''
+		poller, wakeup_fds = select.poll(), self._wakeup_fds
+		for pfd in fds: poller.register(pfd.fd, pfd.events)
+		if wakeup_fds: poller.register(wakeup_fds[0], select.POLLIN)
+		fd_events = dict(poller.poll(None if timeout < 0 else timeout * 1000))
+		if wakeup_fds and fd_events.pop(wakeup_fds[0], None):
+			try:
+				while os.read(wakeup_fds[0], 512): pass
+			except BlockingIOError: pass
+			self.pulse.event_listen_stop()
+		for pfd in fds: pfd.revents = fd_events.get(pfd.fd, 0)
+		return len(fd_events)
+
+	def _run(self, fut, func, args, kws):
+		if not fut.set_running_or_notify_cancel(): return
+		try: res = self.pulse_sync.run(func(self.pulse_sync, *args, **kws))
+		except Exception as err: fut.set_exception(err)
+		else: fut.set_result(res)
+
+	async def _call_trap_errors(self, func, *args, **kws):
+		try: return await func(*args, **kws)
+		except Exception as err:
+			log.exception('Pulse interaction failure, skipping: <{}> {}', err.__class__.__name__, err)
+
+class PAMixerPulseAsyncIO(PAMixerPulseIO):
+	'''PAMixerPulseIO for "asyncio" engine, using pulsectl_asyncio.PulseAsync client,
+			with submit() returning asyncio futures and commands run by serve() task.
+		Commands are still run one at a time and in same order, e.g. to keep volume changes ordered.'''
+
+	def __init__(self, pulse, stats, loop=None):
+		self.pulse, self.stats = pulse, stats
+		self.loop = loop or asyncio.get_event_loop()
+		self._queue, self._stop = deque(), False
+		self._queue_ready = asyncio.Event()
+
+	def submit(self, func, *args, trap_errors=False, **kws):
+		fut = self.loop.create_future()
+		if trap_errors: func = ft.partial(self._call_trap_errors, func)
+		if self._stop: fut.cancel()
+		else:
+			self._queue.append((fut, func, args, kws, time.monotonic()))
+			self._queue_ready.set()
+		return fut
+
+	def call_later(self, delay, func): return self.loop.call_later(delay, func)
+
+	async def serve(self):
+		try:
+			while not self._stop:
+				while self._queue:
+					fut, func, args, kws, ts = self._queue.popleft()
+					self.stats.add('io_queue', time.monotonic() - ts)
+					if fut.cancelled(): continue
+					try: res = await func(self.pulse, *args, **kws)
+					except Exception as err:
+						if not fut.done(): fut.set_exception(err)
+					else:
+						if not fut.done(): fut.set_result(res)
+				self._queue_ready.clear()
+				await self._queue_ready.wait()
+		finally:
+			self._stop = True
+			while self._queue: self._queue.popleft()[0].cancel()
+
+	def stop(self):
+		self._stop = True
+		self._queue_ready.set()
+
+
+class PAMixerItemWriter(object):
+	'''Coalesces volume/mute changes for menu items, sending only latest value for each
+			to pulse, at most once per conf.volume_write_interval, and never more than one batch
+			at a time, so that ui doesn't block on a pulse request for each key-repeat of held-down key.
+		Items keep set values in their optimistic "state" until pulse confirms these,
+			and get notified via item.state_done() after each one is sent.
+		Actual pulse requests and timers are done via menu.io (PAMixerPulseIO).'''
+
+	def __init__(self, menu):
+		self.menu, self.interval = menu, menu.conf.volume_write_interval
+		self._pending = OrderedDict() # (uid, k) -> (item, k, value)
+		self._lock = threading.Lock()
+		self._timer = self._inflight = None
+		self._flush_ts, self._closed = 0, False
+
+	def set(self, item, k, value):
+		if not self.interval: return self._write([(item, k, value)])
+		with self._lock:
+			if self._closed: return
+			self._pending[item.uid, k] = item, k, value
+			self.menu.stats.count('writes_queued')
+			if not (self._timer or self._inflight): self._schedule()
+
+	def _schedule(self):
+		delay = max(0, self._flush_ts + self.interval - time.monotonic())
+		self._timer = self.menu.io.call_later(delay, self.flush)
+
+	def flush(self):
+		'Queues all pending values to be sent to pulse, returning future for that, if any.'
+		with self._lock:
+			writes, self._pending, self._timer = list(self._pending.values()), OrderedDict(), None
+			if not writes: return
+			fut = self._inflight = self._write(writes)
+		fut.add_done_callback(self._flush_done)
+		return fut
+
+	def _flush_done(self, fut):
+		with self._lock:
+			if self._inflight is fut: self._inflight = None
+			self._flush_ts = time.monotonic()
+			if self._pending and not (self._closed or self._timer): self._schedule()
+
+	def close(self, flush=True):
+		'''Stops any scheduled writes, sending pending ones right away, unless flush=False.
+			Returns future for these writes or None, to wait for before closing connection.'''
+		with self._lock:
+			self._closed = True
+			if self._timer: self._timer.cancel()
+			if not flush: self._pending.clear()
+		return self.flush()
+
+	def _write(self, writes):
+		'Returns future for sending values to pulse, which is done after that.'
+		self.menu.stats.count('writes', len(writes))
+		return self.menu.io.submit(self._write_values, writes, trap_errors=True)
+
+	async def _write_values(self, pulse, writes):
+		errors = False
+		for item, k, value in writes:
+			err = None
+			try:
+				if k == 'volume':
+					val_pulse = item.volume_pulse(value)
+					log.debug('Setting volume: {} (pulse: {}) for {}', value, val_pulse, item)
+					await pulse.volume_set_all_chans(item.obj, val_pulse)
+				elif k == 'mute': await pulse.mute(item.obj, value)
+				else: raise ValueError(k)
+			except Exception as err_exc:
+				log.exception( 'Failed to set {} for {},'
+					' skipping: <{}> {}', k, item, err_exc.__class__.__name__, err_exc )
+				err = errors = err_exc
+			item.state_done(k, value, err)
+		wakeup = self.menu.wakeup
+		if errors and wakeup: wakeup() # redraw rolled-back values
+
+
+class PAMixerRuleMatcher(object):
+	'''Compiled checks from [stream-*] config sections (conf.stream_params),
+			to find all sections matching item proplist without running every check in every section.
+		Same checks in different sections are only run once, "equals" checks are dict lookups,
+			"match" regexps for same key are pre-filtered by one combined regexp,
+			only keys that item proplist has are looked at (with only checks that
+			can match empty string - same as missing value - passing for missing ones),
+			and only sections with passed "anchor" check (most selective one) are looked at.
+		Section matches if all its checks match, same as with simple linear scan.
+		Sections are also indexed by proplist keys that they check,
+			to only re-check ones that depend on specific keys when these change.'''
+
+	def __init__(self, stream_params):
+		self.sections, self.section_checks = list(), list() # [(name, params), ...], [{check_n, ...}, ...]
+		self.equals = defaultdict(dict) # key -> {value: check_n}
+		self.missing = defaultdict(list) # key -> [check_n, ...] for checks that match missing value
+		self.anchors = defaultdict(list) # check_n -> [sec_n, ...]
+		self.always = list() # sections without any checks
+		self.checks = list() # [(t, k, v), ...]
+		self.key_sections = defaultdict(set) # key -> {sec_n, ...}
+
+		check_ids, regexps = dict(), defaultdict(list)
+		for sec, sec_checks in (stream_params or dict()).items():
+			sec_n, params, check_ns = len(self.sections), OrderedDict(), set()
+			anchor = None # (priority, check_n)
+			for t, k, v in sec_checks:
+				if t == 'set':
+					params[k] = v
+					continue
+				if t not in ['equals', 'match']: raise ValueError((t, k, v))
+				check_id = t, k, v if t == 'equals' else (v.pattern, v.flags)
+				check_n = check_ids.get(check_id)
+				if check_n is None:
+					check_n = check_ids[check_id] = len(check_ids)
+					self.checks.append((t, k, v))
+					if t == 'equals': self.equals[k][v] = check_n
+					else: regexps[k].append((v, check_n))
+					if not v if t == 'equals' else v.search(''): self.missing[k].append(check_n)
+				check_ns.add(check_n)
+				self.key_sections[k].add(sec_n)
+				priority = (t != 'equals') + 2 * (check_n in self.missing[k])
+				if not anchor or priority < anchor[0]: anchor = priority, check_n
+			self.sections.append((sec, params))
+			self.section_checks.append(check_ns)
+			if anchor: self.anchors[anchor[1]].append(sec_n)
+			else: self.always.append(sec_n)
+
+		self.keys = list() # [(key, equals, regexp, combined, separate, missing), ...]
+		for k in set(self.equals).union(regexps):
+			checks = regexps.get(k, list())
+			combined = list( (v, check_n) for v, check_n in checks
+				if not (v.groups or v.flags & ~re.UNICODE) ) # can't be combined
+			separate = list(c for c in checks if c not in combined)
+			regexp = None
+			if len(combined) > 1:
+				try: regexp = re.compile('|'.join('(?:{})'.format(v.pattern) for v, check_n in combined))
+				except re.error: separate, combined = checks, list()
+			elif combined: regexp = combined[0][0]
+			self.keys.append(( k, self.equals.get(k),
+				regexp, combined, separate, self.missing.get(k) ))
+
+	def match(self, proplist):
+		'Returns list of (section_name, params) for all sections matching proplist, in config order.'
+		return list(map(self.sections.__getitem__, self.match_n(proplist)))
+
+	def match_n(self, proplist):
+		'Same as match(), but returns sorted list of section numbers (indexes in self.sections).'
+		passed = set()
+		for k, equals, regexp, combined, separate, missing in self.keys:
+			v = proplist.get(k)
+			if v is None:
+				if missing: passed.update(missing)
+				continue
+			if equals:
+				check_n = equals.get(v)
+				if check_n is not None: passed.add(check_n)
+			if regexp and regexp.search(v): # combined regexp, or the only one for key
+				if len(combined) == 1: passed.add(combined[0][1])
+				else: passed.update(check_n for regexp, check_n in combined if regexp.search(v))
+			if separate: passed.update(check_n for regexp, check_n in separate if regexp.search(v))
+		if not passed: return list(self.always)
+		secs, anchors, section_checks = list(self.always), self.anchors, self.section_checks
+		for check_n in passed:
+			if check_n not in anchors: continue
+			secs.extend(sec_n for sec_n in anchors[check_n] if section_checks[sec_n] <= passed)
+		if len(secs) > 1: secs.sort()
+		return secs
+
+	def keys_changed(self, props_old, props_new):
+		'Returns list of proplist keys that any sections depend on, which have different values.'
+		if props_old == props_new: return list()
+		return list(k for k in self.key_sections if props_old.get(k) != props_new.get(k))
+
+	def match_changed(self, proplist, keys, matched):
+		'''Returns (added, removed) lists of section numbers, that started or stopped
+				matching proplist after changes in specified keys, with "matched" being
+				a set of section numbers that matched before.
+			Only sections that have checks for these keys are re-checked.'''
+		secs = set()
+		for k in keys: secs.update(self.key_sections.get(k, ()))
+		added, removed = list(), list()
+		for sec_n in sorted(secs):
+			if all(self.check(check_n, proplist) for check_n in self.section_checks[sec_n]):
+				if sec_n not in matched: added.append(sec_n)
+			elif sec_n in matched: removed.append(sec_n)
+		return added, removed
+
+	def check(self, check_n, proplist):
+		t, k, v = self.checks[check_n]
+		value = proplist.get(k, '')
+		return value == v if t == 'equals' else bool(v.search(value))
+
+
 class PAMixerMenu(object):
 
 	focus_policies = dict(first=op.itemgetter(0), last=op.itemgetter(-1))
 
-	def __init__(self, pulse, conf=None, fatal=False):
+	def __init__(self, pulse, conf=None, fatal=False, stats=None, names=None, io=None):
 		self.pulse, self.fatal, self.conf = pulse, fatal, conf or Conf()
-		self.items, self.item_objs = list(), OrderedDict()
+		self.stats, self.names = stats or PAMixerStats(), names or PAMixerNameRegistry()
+		self.stats.gauges['strip_noise_cache'] = PAMixerMenuItem.strip_noise_stats
+		self.item_name_formats = PAMixerMenuItem.name_formats_compile(self.conf)
+		self.rules = PAMixerRuleMatcher(self.conf.stream_params)
+		self.writes = PAMixerItemWriter(self)
+		self.items, self.item_objs = PAMixerItemIndex(), OrderedDict()
 		self.connected, self._updates = None, deque()
-		self._pulse_hold, self._pulse_lock = threading.Lock(), threading.Lock()
-
-	def update(self):
+		self.io = io or PAMixerPulseIO(pulse, self.stats)
+		self._update_fetch = self.wakeup = None # wakeup - callback to interrupt ui loop
+
+	def update_events(self):
+		'''Pops all queued events and collapses them into one net action per object.
+			Returns None if full update was requested (None-event in the queue),
+				otherwise {obj_type: {obj_index: action}} dict (empty if nothing was queued),
+				with action being one of: "fetch" (new/changed object),
+				"remove" or "replace" (removed, then new with same index).'''
+		full, actions = False, defaultdict(OrderedDict)
 		while True:
 			try: ev = self._updates.popleft()
-			except: ev = None
+			except IndexError: break
+			self.stats.count('events')
+			if not ev: full = True
+			if full: continue
+			obj_actions = actions[ev.obj_type]
+			action = obj_actions.get(ev.obj_index)
+			if ev.t == 'remove': action = 'remove'
+			elif action == 'remove': action = 'replace'
+			elif not action: action = 'fetch'
+			obj_actions[ev.obj_index] = action
+		if full: return
+		self.stats.count('events_coalesced', sum(map(len, actions.values())))
+		return actions
+
+	_update_synced = False # set after first full update
+	_update_rtt_info = _update_rtt_list = None # EWMA of fetch times per info-request and listed object
+
+	def update_path(self, actions):
+		'''Returns how to process coalesced actions - "full" or "resync" (full list diff),
+				"incremental" (info request per object) or "idle" (nothing to do).
+			"resync" is picked for large batches, either when number of objects to fetch
+				exceeds update-resync-threshold or when it's estimated to take longer than
+				fetching full lists, based on measured (and smoothed) pulse request times.'''
+		if actions is None or not self._update_synced: return 'full'
+		n = sum(1 for obj_actions in actions.values() for a in obj_actions.values() if a != 'remove')
+		if not n: return 'incremental' if any(actions.values()) else 'idle'
+		threshold = self.conf.update_resync_threshold
+		if threshold and n >= threshold: return 'resync'
+		if self.conf.update_resync_adaptive\
+				and self._update_rtt_info and self._update_rtt_list:
+			if n * self._update_rtt_info > self._update_rtt_list * len(self.item_objs): return 'resync'
+		return 'incremental'
+
+	def _update_rtt(self, k, value, alpha=0.3):
+		k = '_update_rtt_{}'.format(k)
+		v = getattr(self, k)
+		setattr(self, k, value if v is None else v + alpha * (value - v))
 
+	def update(self):
+		'''Processes queued pulse events, with changed objects fetched via pulse i/o (menu.io).
+			When pulse i/o thread/task is running, returns without waiting for these to be fetched,
+				and applies results on the next call, after main thread gets woken up by it.'''
+		while True:
 			# Restarts whole thing with new pulse connection
 			if self.connected is False: raise PAMixerReconnect()
 
-			# Add/remove/update items
-			obj_new, obj_gone = set(), set()
-			obj_id_func = lambda t,index: '{}-{}'.format(t, index)
-			if not ev: obj_gone.update(self.item_objs) # i.e. replace whole list
-			with self.update_wakeup(trap_errors=False) as pulse:
-				for obj_t, obj_list_func, obj_info_func in\
-						[ ('sink', pulse.sink_list, pulse.sink_info),
-							('stream', pulse.sink_input_list, pulse.sink_input_info) ]:
-
-					obj_list_full = obj_list = None # "replace all" vs "new/update X"
-					if not ev: obj_list_full = obj_list_func()
-					elif ev.obj_type != obj_t: continue
-					elif ev.t == 'remove': obj_gone.add(obj_id_func(obj_t, ev.obj_index))
-					else:
-						try: obj_list = [obj_info_func(ev.obj_index)]
-						except PulseIndexError: continue # likely already gone
-
-					for obj in obj_list or obj_list_full or list(): # new/updated
-						obj_id = obj_id_func(obj_t, obj.index)
-						if obj_id not in self.item_objs:
-							obj_new.add(obj_id)
-							self.item_objs[obj_id] = PAMixerMenuItem(self, obj_t, obj_id, obj)
-						elif obj_list_full is None: self.item_objs[obj_id].update(obj)
-						obj_gone.discard(obj_id)
-
-			for obj_id in obj_gone: self.item_objs.pop(obj_id, None)
-			for obj_id in obj_new:
-				item = self.item_objs[obj_id]
-				try: self.apply_stream_params(item)
-				except Exception as err:
-					log.exception(
-						'Failed to apply stream parameters for {}, skipping: <{}> {}',
-						item, err.__class__.__name__, err )
-
-			# Sort sinks to be always on top
-			sinks, streams, ordered = list(), list(), True
-			for obj_id, item in self.item_objs.items():
-				if item.t == 'sink':
-					if streams: ordered = False
-					sinks.append((obj_id, item))
-				else: streams.append((obj_id, item))
-			if not ordered:
-				self.item_objs.clear()
-				for obj_id, item in it.chain(sinks, streams): self.item_objs[obj_id] = item
-
-			# Make item names unique
-			items_uniq = defaultdict(list)
-			for item in self.item_objs.values(): items_uniq[item.name_base].append(item)
-			for items in items_uniq.values():
-				if len(items) <= 1: continue
-				for item in items:
-					if item.name != item.name_base: continue
-					item.name = '{} #{}'.format(item.name_base, uid_str())
-
-			self.items = list(item for item in self.item_objs.values() if not item.hidden)
-			if not self._updates: break
-
-	_update_wakeup_break = None
+			if self._update_fetch:
+				if not self._update_fetch.done(): break
+				fetch, self._update_fetch = self._update_fetch, None
+				try: self.update_apply(*fetch.result())
+				except (PulseDisconnected, CancelledError, asyncio.CancelledError): # pulse i/o stopped
+					self.connected = False
+					continue
+
+			actions = self.update_events()
+			path = self.update_path(actions)
+			self.stats.count('update_{}'.format(path))
+			if path == 'idle':
+				if not self._updates: break
+				continue
+			log.debug( 'Update path: {} ({} object(s))', path,
+				len(self.item_objs) if not actions else sum(map(len, actions.values())) )
+			fetch, wakeup = self.io.submit(self.update_fetch, path, actions), self.wakeup
+			if wakeup and not fetch.done(): fetch.add_done_callback(lambda fetch: wakeup())
+			self._update_fetch = fetch
+
+	def update_pending(self):
+		'Returns True if update() has any queued events or fetched results to process.'
+		fetch = self._update_fetch
+		return bool(self._updates or (fetch and fetch.done()) or self.connected is False)
+
+	def update_fetching(self):
+		'Returns True if update() fetch is in progress, and will need another call when done.'
+		fetch = self._update_fetch
+		return bool(fetch and not fetch.done())
+
+	async def update_fetch(self, pulse, path, actions):
+		'''Fetches new/changed objects from pulse for update(), run via menu.io.
+			Returns (path, actions, results), with results being a list of
+				(obj_t, fetch_ts, obj_list_full, obj_list, gone_indexes) tuples for sinks and streams,
+				where obj_list_full is a list of all objects for "full" and "resync" paths,
+				and obj_list - ones that were fetched by index for "incremental" path.'''
+		results, list_time, list_count = list(), 0, 0
+		for obj_t, obj_list_func, obj_info_func in\
+				[ ('sink', pulse.sink_list, pulse.sink_info),
+					('stream', pulse.sink_input_list, pulse.sink_input_info) ]:
+			obj_list_full = obj_list = None # "replace all" vs "new/update X"
+			fetch_ts, gone = time.monotonic(), list()
+			with self.stats.phase('fetch'):
+				if path in ['full', 'resync']:
+					obj_list_full = await obj_list_func()
+					list_time += time.monotonic() - fetch_ts
+					list_count += len(obj_list_full)
+				else:
+					obj_list = list()
+					for obj_index, action in actions.get(obj_t, dict()).items():
+						if action == 'remove': continue
+						ts = time.monotonic()
+						try: obj_list.append(await obj_info_func(obj_index))
+						except PulseIndexError: gone.append(obj_index) # likely already gone
+						self._update_rtt('info', time.monotonic() - ts)
+			results.append((obj_t, fetch_ts, obj_list_full, obj_list, gone))
+		if list_time: self._update_rtt('list', list_time / max(1, list_count))
+		return path, actions, results
+
+	def update_apply(self, path, actions, results):
+		'Adds/removes/updates items from update_fetch() results.'
+		obj_new, obj_updated, obj_gone = list(), list(), set()
+		props_changed = list() # [(item, keys), ...] - for re-checking stream rules
+		obj_id_func = lambda t,index: '{}-{}'.format(t, index)
+		for obj_t, fetch_ts, obj_list_full, obj_list, gone in results:
+			with self.stats.phase('items'):
+				for obj_index, action in (actions or dict()).get(obj_t, dict()).items():
+					obj_id = obj_id_func(obj_t, obj_index)
+					if action == 'replace': self.item_remove(obj_id)
+					elif action == 'remove': obj_gone.add(obj_id)
+				if obj_list_full is not None:
+					obj_gone.update(obj_id for obj_id, item in self.item_objs.items() if item.t == obj_t)
+				obj_gone.update(obj_id_func(obj_t, obj_index) for obj_index in gone)
+				for obj in obj_list or obj_list_full or list(): # new/updated
+					obj_id = obj_id_func(obj_t, obj.index)
+					item = self.item_objs.get(obj_id)
+					if not item:
+						obj_new.append(obj_id)
+						self.item_objs[obj_id] = PAMixerMenuItem(self, obj_t, obj_id, obj)
+					elif obj_list_full is None or item.obj_changed(obj):
+						keys = self.rules.keys_changed(item.obj.proplist, obj.proplist)
+						if keys: props_changed.append((item, keys))
+						item.update(obj, fetch_ts)
+						obj_updated.append(item)
+					obj_gone.discard(obj_id)
+		self._update_synced = True
+
+		with self.stats.phase('params'):
+			for obj_id in obj_gone: self.item_remove(obj_id)
+			self.apply_stream_params(
+				list(map(self.item_objs.__getitem__, obj_new)), props_changed, obj_updated )
+
+		with self.stats.phase('index'): # sinks are always on top there
+			for obj_id in obj_new: self.items.update(self.item_objs[obj_id])
+			for item, keys in props_changed: self.items.update(item) # can get hidden/unhidden
+
+		with self.stats.phase('names'): # make item names unique
+			if path == 'full': self.names.retain(self.item_objs) # e.g. after reconnect
+			items = list(it.chain(obj_updated, (self.item_objs[obj_id] for obj_id in obj_new)))
+			self.names.update(*items)
+			for item in items: self.items.name_update(item)
+
+	def item_remove(self, obj_id):
+		item = self.item_objs.pop(obj_id, None)
+		if not item: return
+		self.items.remove(item)
+		self.names.release(obj_id)
+
 	@contextmanager
 	def update_wakeup_poller( self, wakeup_handler,
 			wakeup_pid=None, wakeup_sig=signal.SIGUSR1 ):
+		'''Returns pulse i/o thread (to be started by caller), running all
+				pulse requests via PAMixerPulseIO and listening for events in-between these,
+				which are passed to wakeup_handler in the main thread, interrupted by wakeup_sig.
+			With separate events connection in PAMixerPulseIO, returned thread only listens for
+				events, and another one for pulse requests is started here right away,
+				so that these don't interrupt event listening, and never run in the caller thread.
+			Same signal is used to wake up main thread when update() fetch results are ready.'''
 		if wakeup_pid is None: wakeup_pid = os.getpid()
 		def ev_sig_handler(sig=None, frm=None):
 			while True:
@@ -347,85 +1183,180 @@ class PAMixerMenu(object):
 			if poller_thread is threading.current_thread(): os.kill(wakeup_pid, wakeup_sig)
 			else: ev_sig_handler()
 		def poller():
-			self.pulse.event_mask_set('sink', 'sink_input')
-			self.pulse.event_callback_set(ev_cb)
-			while True:
-				with self._pulse_hold: self._pulse_lock.acquire() # ...threads ;(
-				if self._update_wakeup_break:
-					log.error('Stopping poller due to update_wakeup_break')
-					break
-				try: self.pulse.event_listen()
-				except PulseDisconnected:
-					ev_cb()
-					break
-				finally: self._pulse_lock.release()
-				if not poller_thread: break
+			pulse = self.io.pulse_events or self.pulse
+			pulse.event_mask_set('sink', 'sink_input')
+			pulse.event_callback_set(ev_cb)
+			try:
+				if pulse is self.pulse: self.io.serve()
+				else: self.io.listen()
+			except PulseDisconnected: ev_cb()
 		ev_queue = deque()
 		signal.signal(wakeup_sig, ev_sig_handler)
 		poller_thread = threading.Thread(target=poller, name='pulsectl', daemon=True)
+		io_thread = poller_thread if not self.io.pulse_events else\
+			threading.Thread(target=self.io.serve, name='pulsectl-io', daemon=True)
+		self.io.thread, self.wakeup = io_thread, lambda: os.kill(wakeup_pid, wakeup_sig)
+		if io_thread is not poller_thread: io_thread.start()
 		try: yield poller_thread
 		finally:
-			self.pulse.event_listen_stop()
-			poller_thread, t = None, poller_thread
-			# if t.is_alive(): t.join()
-			# time.sleep(0.5)
+			self.io.stop()
+			self.wakeup, poller_thread = None, None
 
 	@contextmanager
-	def update_wakeup(self, trap_errors=True, loop_interval=0.03):
-		'Anything pulse-related MUST be done in this context.'
-		with self._pulse_hold:
-			for n in range(int(5.0 / loop_interval)):
-				# wakeup only works when loop is actually started,
-				#  which might not be the case regardless of any locks.
-				self.pulse.event_listen_stop()
-				if self._pulse_lock.acquire(timeout=loop_interval): break
-			else:
-				raise RuntimeError('poll_wakeup() hangs, likely locking issue')
-			try: yield self.pulse
-			except Exception as err:
-				if not trap_errors:
-					self._update_wakeup_break = True
-					raise
-				log.exception('Pulse interaction failure, skipping: <{}> {}', err.__class__.__name__, err)
-			finally: self._pulse_lock.release()
+	def update_wakeup_tasks(self, wakeup_handler, wakeup):
+		'''Same as update_wakeup_poller() for "asyncio" engine, starting tasks for
+				PAMixerPulseAsyncIO commands and pulse event subscription in current event loop,
+				with events passed to wakeup_handler right away, followed by wakeup() call.'''
+		async def events():
+			try:
+				async for ev_pulse in self.pulse.subscribe_events('sink', 'sink_input'):
+					log.debug('pulsectl event: {} {} {}', ev_pulse.facility, ev_pulse.t, ev_pulse.index)
+					ev = PAMixerEvent.from_pulsectl_ev(ev_pulse)
+					if not ev: continue
+					wakeup_handler(ev)
+					wakeup()
+			except PulseDisconnected: pass
+			log.debug('pulsectl disconnected')
+			wakeup_handler(disconnected=True)
+		tasks = list(map(asyncio.ensure_future, [self.io.serve(), events()]))
+		self.wakeup = wakeup
+		try: yield tasks
+		finally:
+			self.io.stop()
+			self.wakeup = None
+			for task in tasks: task.cancel()
 
 	def update_wakeup_handler(self, ev=None, disconnected=False):
 		if disconnected:
 			self.connected = False
-			signal.pthread_kill(threading.main_thread().ident, signal.SIGWINCH)
+			wakeup = self.wakeup
+			if wakeup: wakeup()
 		elif self.connected is None: self.connected = True
 		self._updates.append(ev)
 
-	def apply_stream_params(self, item):
-		for sec, checks in (self.conf.stream_params or dict()).items():
-			match, params = True, OrderedDict()
-			for t, k, v in checks:
-				if t == 'match':
-					if match and not v.search(item.obj.proplist.get(k, '')): match = False
-				elif t == 'set': params[k] = v
-				else: raise ValueError((t, k, v))
-			if match:
-				log.debug( 'Matched stream {!r} (name: {!r})'
-					' to config section: {}', item, item.name, sec )
-				for k, v in params.items():
-					m = re.search(r'^volume-(min|max|set)$', k)
-					if m:
-						vol = float(v)
-						if m.group(1) == 'max':
-							if item.volume > vol: item.volume = vol
-						elif m.group(1) == 'min':
-							if item.volume < vol: item.volume = vol
-						elif m.group(1) == 'set': item.volume = vol
-					elif k == 'hidden': item.hidden = self.conf.parse_bool(v)
-					elif k == 'port':
-						try: item.port = v
-						except PAMixerInvalidAction as err:
-							log.error( 'Unable to set port for stream {!r}'
-								' (name: {!r}, config section: {}): {}', item, item.name, sec, err )
-					elif k == 'name': item.name_update(v)
-					else:
-						log.debug( 'Unrecognized stream'
-							' parameter (section: {!r}): {!r} (value: {!r})', sec, k, v )
+	def stream_params_plan(self, item, secs):
+		'''Returns dict with net effect of specified config sections (numbers in self.rules),
+				matching item - final volume, port, hidden and name values -
+				with only ones that need to be set in there.
+			Actions from all sections are folded in the same order as they'd be applied one-by-one.'''
+		plan, vol = dict(), item.volume
+		for sec, params in map(self.rules.sections.__getitem__, secs):
+			log.debug( 'Matched stream {!r} (name: {!r})'
+				' to config section: {}', item, item.name, sec )
+			for k, v in params.items():
+				m = re.search(r'^volume-(min|max|set)$', k)
+				if m:
+					v = float(v)
+					if m.group(1) == 'max': vol = min(vol, v)
+					elif m.group(1) == 'min': vol = max(vol, v)
+					elif m.group(1) == 'set': vol = v
+					plan['volume'] = vol
+				elif k == 'hidden': plan['hidden'] = self.conf.parse_bool(v)
+				elif k == 'port':
+					try: item.port_check(v)
+					except PAMixerInvalidAction as err:
+						log.error( 'Unable to set port for stream {!r}'
+							' (name: {!r}, config section: {}): {}', item, item.name, sec, err )
+					else: plan['port'] = v
+				elif k == 'name': plan['name'] = v
+				else:
+					log.debug( 'Unrecognized stream'
+						' parameter (section: {!r}): {!r} (value: {!r})', sec, k, v )
+		if plan.get('volume') == item.volume: del plan['volume']
+		if 'port' in plan and plan['port'] == getattr(item.port, 'name', None): del plan['port']
+		return plan
+
+	def stream_params_plan_changed(self, item, keys):
+		'''Returns stream_params_plan() for item with changed proplist keys, with
+				volume/port actions only from sections that started matching it after that change,
+				and hidden/name state from all sections matching it now (reverted if none set these).
+			Only sections that depend on changed keys are re-checked.'''
+		added, removed = self.rules.match_changed(item.obj.proplist, keys, item.rules_matched)
+		if not (added or removed): return dict()
+		if removed: log.debug('Stream {!r} no longer matches config sections: {}', item, ', '.join(
+			self.rules.sections[sec_n][0] for sec_n in removed ))
+		item.rules_matched = item.rules_matched.difference(removed).union(added)
+		item.volume_limits = self.volume_limits(item.rules_matched)
+		plan = self.stream_params_plan(item, added)
+		state = dict( (k, params[k]) for sec, params in
+			map(self.rules.sections.__getitem__, sorted(item.rules_matched))
+			for k in ['hidden', 'name'] if k in params )
+		plan['hidden'] = self.conf.parse_bool(state.get('hidden', 'no'))
+		plan['name'] = state.get('name')
+		if plan['hidden'] == item.hidden: del plan['hidden']
+		if plan['name'] == (item.name_base if item.name_custom else None): del plan['name']
+		return plan
+
+	def volume_limits(self, secs):
+		'''Returns (min, max) volume limits from specified config sections, or None if there are none.
+			Only used with volume-limits-enforce option, tightest limits are used if there are several.'''
+		if not self.conf.volume_limits_enforce: return
+		vmin = vmax = None
+		for sec, params in map(self.rules.sections.__getitem__, secs):
+			if 'volume-min' in params: vmin = max(vmin or 0, float(params['volume-min']))
+			if 'volume-max' in params: vmax = min(1.0 if vmax is None else vmax, float(params['volume-max']))
+		if vmin is None and vmax is None: return
+		return (vmin or 0), (1.0 if vmax is None else vmax)
+
+	def volume_limits_check(self, item):
+		'''Returns volume to set for item with volume_limits, if its current one is out of these
+			(by more than volume-limits-hysteresis value), unless corrections for it are rate-limited.'''
+		if not item.volume_limits: return
+		(vmin, vmax), vol = item.volume_limits, item.volume
+		if vmin - self.conf.volume_limits_hysteresis <= vol <= vmax + self.conf.volume_limits_hysteresis: return
+		(ts0, n), ts = item.volume_limits_fixes, time.monotonic()
+		if ts - ts0 > self.conf.volume_limits_interval: ts0, n = ts, 0
+		n += 1
+		item.volume_limits_fixes = ts0, n
+		if n > self.conf.volume_limits_burst:
+			if n == self.conf.volume_limits_burst + 1:
+				log.info( 'Volume for {!r} keeps going out of limits,'
+					' not correcting it for up to {:.1f}s', item, self.conf.volume_limits_interval )
+			return
+		self.stats.count('volume_limits_fixes')
+		log.debug('Volume {:.2f} for {!r} is out of limits {}, correcting it', vol, item, item.volume_limits)
+		return min(vmax, max(vmin, vol))
+
+	def apply_stream_params(self, items, props_changed=None, updated=None):
+		'''Applies config sections matching each of the new items, and ones that
+				started/stopped matching items from props_changed list of (item, changed_keys) tuples,
+				as well as volume limits for updated items with volume-limits-enforce option,
+			with at most one volume and one port change per item,
+				and all of these queued to pulse i/o thread in one go.'''
+		writes = OrderedDict()
+		for item, keys in it.chain(((item, None) for item in items), props_changed or list()):
+			try:
+				if keys is None:
+					item.rules_matched = set(self.rules.match_n(item.obj.proplist))
+					item.volume_limits = self.volume_limits(item.rules_matched)
+					plan = self.stream_params_plan(item, sorted(item.rules_matched))
+				else: plan = self.stream_params_plan_changed(item, keys)
+				if 'hidden' in plan: item.hidden = plan['hidden']
+				if 'name' in plan:
+					if plan['name']: item.name_update(plan['name'])
+					else: item.name_reset()
+			except Exception as err:
+				log.exception( 'Failed to apply stream parameters'
+					' for {}, skipping: <{}> {}', item, err.__class__.__name__, err )
+				continue
+			if 'volume' in plan or 'port' in plan: writes[item.uid] = item, plan
+		for item in (updated or list()) if self.conf.volume_limits_enforce else list():
+			if 'volume' in writes.get(item.uid, (None, ()))[1]: continue
+			vol = self.volume_limits_check(item)
+			if vol is None: continue
+			writes.setdefault(item.uid, (item, dict()))[1]['volume'] = vol
+		if writes: self.io.submit(self._stream_params_write, list(writes.values()), trap_errors=True)
+
+	async def _stream_params_write(self, pulse, writes):
+		for item, plan in writes:
+			try:
+				if 'volume' in plan:
+					log.debug('Setting volume: {} for {}', plan['volume'], item)
+					await pulse.volume_set_all_chans(item.obj, item.volume_pulse(plan['volume']))
+				if 'port' in plan: await pulse.port_set(item.obj, plan['port'])
+			except Exception as err:
+				log.exception( 'Failed to apply stream parameters'
+					' for {}, skipping: <{}> {}', item, err.__class__.__name__, err )
 
 	@property
 	def item_list(self):
@@ -438,26 +1369,25 @@ class PAMixerMenu(object):
 		return func(self.items)
 
 	def item_newer(self, ts):
-		items = sorted(self.items, key=op.attrgetter('created_ts'), reverse=True)
-		if items and items[0].created_ts > ts: return items[0]
+		item = self.items.newest()
+		if item and item.created_ts > ts: return item
 
 	def item_after(self, item=None):
-		if item:
-			for item2 in self.items:
-				if item is StopIteration: return item2
-				if item2.uid == item.uid: item = StopIteration
+		n = item and self.items.position(item)
+		if n is not None and n + 1 < len(self.items): return self.items[n + 1]
 		return self.item_default()
 
 	def item_before(self, item=None):
-		if item:
-			item_prev = None
-			for item2 in self.items:
-				if item2.uid == item.uid:
-					if not item_prev: break
-					return item_prev
-				item_prev = item2
+		n = item and self.items.position(item)
+		if n: return self.items[n - 1]
 		return self.item_default()
 
+	def item_offset(self, item, delta):
+		'Returns item at specified offset from the given one, stopping at first/last one.'
+		n = item and self.items.position(item)
+		if n is None: return self.item_default()
+		return self.items[max(0, min(len(self.items) - 1, n + delta))]
+
 
 
 class PAMixerUI(object):
@@ -485,9 +1415,16 @@ class PAMixerUI(object):
 		# Used to create a window with borders here,
 		#  but these borders don't seem to be cleared properly.
 		# So using stdscr now, and painting borders in the app.
+		# With output-mode=pad, drawing is done in off-screen pad of the same size instead,
+		#  with stdscr only used for input, and pad contents copied to it from c_output().
 		win = self.c_stdscr
 		win.keypad(True)
 		win.bkgdset(' ')
+		if self.conf.output_mode == 'pad':
+			win.noutrefresh() # so that getch() won't repaint empty stdscr over pad contents
+			win = self.c.newpad(*win.getmaxyx())
+			win.bkgdset(' ')
+		self.c_rows = None # full repaint on next c_win_draw()
 		return win
 
 	def c_win_size(self, win):
@@ -496,32 +1433,58 @@ class PAMixerUI(object):
 		nlines, ncols = max(1, size[0] - 2 * self.border), max(1, size[1] - 2 * self.border)
 		return nlines, ncols, min(self.border, size[0]), min(self.border, size[1])
 
+	c_rows = c_rows_size = None
+	c_row_cache = dict()
+
 	def c_win_draw(self, win, items, item_hl):
-		win.erase()
-		if not items: return
+		'''Draws items in the window, only repainting rows that differ from last call.
+			Each row is rendered from (name, volume, muted, highlighted, widths) key,
+				which is also stored in c_rows to compare against, and rendered lines for
+				these keys are reused from previous call, e.g. when items shift between rows.'''
+		size = win.getmaxyx()
+		if self.c_rows is None or self.c_rows_size != size:
+			win.erase()
+			self.c_rows, self.c_rows_size = dict(), size
+			self.c_output_pending = True
+		rows = self.c_win_rows(win, items, item_hl)
+
+		cache, self.c_row_cache = self.c_row_cache, dict()
+		for row in set(self.c_rows).difference(rows):
+			win.move(row, 0)
+			win.clrtoeol()
+			del self.c_rows[row]
+			self.c_output_pending = True
+		for row, key in rows.items():
+			line = self.c_row_cache[key] = cache.get(key) or self.c_row_render(*key)
+			if self.c_rows.get(row) == key: continue
+			self.menu.stats.count('draw_rows')
+			win.move(row, 0)
+			win.clrtoeol()
+			for x, text, attrs in line: win.addstr(row, x, text, attrs)
+			self.c_rows[row] = key
+			self.c_output_pending = True
+
+	def c_win_rows(self, win, items, item_hl):
+		'''Returns {row: key} for items that fit into window, with key for c_row_render().
+			Only items in a viewport starting at c_top offset are looked at,
+				with offset kept between calls and only scrolled to keep item_hl visible.'''
+		if not items: return dict()
 
 		win_rows, win_len, pad_x, pad_y = self.c_win_size(win)
-		if win_len <= 1: return # nothing fits
+		if win_len <= 1: return dict() # nothing fits
 
 		# Fit stuff vertically
-		if win_rows < len(items) + 1: # pick/display items near highlighted one
-			pos, offset = items.index(item_hl), 1
-			items, items_fit = dict(enumerate(items)), {pos: items[pos]}
-			while True:
-				ps = list(p for p in [pos + offset, pos - offset] if p in items)
-				if not ps: break
-				for p in ps:
-					items_fit[p] = items[p]
-					if win_rows <= len(items_fit) + 1: break
-				else:
-					offset += 1
-					continue
-				break
-			items = map(op.itemgetter(1), sorted(items_fit.items(), key=op.itemgetter(0)))
+		rows_len = win_rows - 1 # not sure why bottom window row seem to be unusable
+		if rows_len <= 0: return dict()
+		top, pos = self.c_top, items.index(item_hl)
+		if pos < top: top = pos
+		elif pos >= top + rows_len: top = pos - rows_len + 1
+		top = self.c_top = max(0, min(top, len(items) - rows_len))
+		items_fit = items[top:top + rows_len]
 
 		# Fit stuff horizontally
 		mute_button_len, level_len = 2, 5
-		item_len_max = max(len(item.name) for item in items)
+		item_len_max = items.name_len_max()
 		if self.conf.name_show_level: item_len_max += level_len
 		if self.conf.name_len_max:
 			item_len_max = min(item_len_max, self.conf.name_len_max)
@@ -530,35 +1493,85 @@ class PAMixerUI(object):
 			item_len_max = max(self.item_len_min, item_len_max + bar_len - self.bar_len_min)
 			bar_len = win_len - item_len_max - mute_button_len - len(self.bar_caps_func())
 			if bar_len <= 0: item_len_max = win_len # just draw labels
-			if item_len_max < self.item_len_min: item_len_max = max(len(item.name) for item in items)
-
-		for row, item in enumerate(items):
-			if row >= win_rows - 1: break # not sure why bottom window row seem to be unusable
-			row += pad_y
-
-			attrs = self.c.A_REVERSE if item is item_hl else self.c.A_NORMAL
-			name_len = item_len_max - bool(self.conf.name_show_level) * level_len
-			name = self.name_cut_funcs[self.conf.name_cut_from](item.name, name_len)
-
-			if self.conf.name_show_level:
-				level = max(0, min(100, int(round(item.volume * 100))))
-				if level == 0: level = '--'
-				elif level == 100: level = '++'
-				else: level = '{:>2d}'.format(level)
-				name = '[{}] {}'.format(level, name)
-
-			win.addstr(row, 0, ' ' * pad_x)
-			win.addstr(row, pad_x, name, attrs)
-			item_name_end = item_len_max + pad_x
-			if win_len > item_name_end + mute_button_len:
-				if item.muted: mute_button = ' M'
-				else: mute_button = ' -'
-				win.addstr(row, item_name_end, mute_button)
-
-				if bar_len > 0:
-					bar_fill = int(round(item.volume * bar_len))
-					bar = self.bar_caps_func('#' * bar_fill + '-' * (bar_len - bar_fill))
-					win.addstr(row, item_name_end + mute_button_len, bar)
+			if item_len_max < self.item_len_min: item_len_max = items.name_len_max()
+
+		rows, widths = dict(), (win_len, pad_x, item_len_max, mute_button_len, level_len, bar_len)
+		for row, item in enumerate(items_fit):
+			rows[row + pad_y] = item.name, item.volume, item.muted, item is item_hl, widths
+		return rows
+
+	def c_row_render(self, name, volume, muted, hl, widths):
+		'Returns list of (x, text, attrs) to draw on a row for item with specified state.'
+		win_len, pad_x, item_len_max, mute_button_len, level_len, bar_len = widths
+		attrs = self.c.A_REVERSE if hl else self.c.A_NORMAL
+		name_len = item_len_max - bool(self.conf.name_show_level) * level_len
+		name = self.name_cut_funcs[self.conf.name_cut_from](name, name_len)
+
+		if self.conf.name_show_level:
+			level = max(0, min(100, int(round(volume * 100))))
+			if level == 0: level = '--'
+			elif level == 100: level = '++'
+			else: level = '{:>2d}'.format(level)
+			name = '[{}] {}'.format(level, name)
+
+		line = [(0, ' ' * pad_x, self.c.A_NORMAL), (pad_x, name, attrs)]
+		item_name_end = item_len_max + pad_x
+		if win_len > item_name_end + mute_button_len:
+			if muted: mute_button = ' M'
+			else: mute_button = ' -'
+			line.append((item_name_end, mute_button, self.c.A_NORMAL))
+
+			if bar_len > 0:
+				bar_fill = int(round(volume * bar_len))
+				bar = self.bar_caps_func('#' * bar_fill + '-' * (bar_len - bar_fill))
+				line.append((item_name_end + mute_button_len, bar, self.c.A_NORMAL))
+		return line
+
+	c_output_pending, c_output_ts = False, 0
+	c_output_wchar = True # False if it can't be read on this platform
+
+	def c_output(self):
+		'''Sends changes drawn since last call to terminal, returning None,
+			or delay in seconds until that can be done, if rate-limited with output-mode=pad.'''
+		if not self.c_output_pending: return
+		pad = self.conf.output_mode == 'pad'
+		if pad and self.conf.output_fps_max:
+			delay = self.c_output_ts + 1.0 / self.conf.output_fps_max - time.monotonic()
+			if delay > 0: return delay
+		wchar = self.c_output_wchar_get() if self.c_output_wchar else None
+		with self.menu.stats.phase('output'):
+			if pad:
+				rows, cols = self.c_stdscr.getmaxyx()
+				self.c_win.noutrefresh(0, 0, 0, 0, rows - 1, cols - 1)
+				self.c.doupdate()
+			else: self.c_win.refresh()
+		if wchar is not None:
+			wchar_new = self.c_output_wchar_get()
+			if wchar_new is not None: self.c_output_count(wchar_new - wchar)
+		self.c_output_pending, self.c_output_ts = False, time.monotonic()
+
+	def c_output_wchar_get(self):
+		'''Returns number of bytes written by current thread, which are
+			all from curses when measured around refresh calls in main thread.'''
+		try:
+			with open('/proc/thread-self/io', 'rb') as src:
+				for line in src:
+					if line.startswith(b'wchar:'): return int(line.split()[1])
+		except OSError: pass
+		self.c_output_wchar = False
+
+	def c_output_count(self, n):
+		'Adds number of bytes written to terminal to stats, tracking per-second peak rate.'
+		self.menu.stats.count('term_bytes', n)
+		ts = int(time.monotonic())
+		if ts != self.c_output_sec: self.c_output_sec, self.c_output_sec_bytes = ts, 0
+		self.c_output_bytes += n
+		self.c_output_sec_bytes += n
+		self.c_output_peak = max(self.c_output_peak, self.c_output_sec_bytes)
+
+	def c_output_stats(self):
+		secs = max(1, time.monotonic() - self.c_output_start)
+		return 'avg={:.0f}B/s peak={}B/s'.format(self.c_output_bytes / secs, self.c_output_peak)
 
 	def c_key(self, k):
 		if len(k) == 1: return ord(k)
@@ -581,50 +1594,132 @@ class PAMixerUI(object):
 		self._item_hl, self._item_hl_ts = item, time.monotonic()
 
 
-	def _run(self, stdscr):
+	def _run_init(self, stdscr):
 		c, self.c_stdscr = self.c, stdscr
-		key_match = lambda key,*choices: key in map(self.c_key, choices)
-
 		c.curs_set(0)
 		c.use_default_colors()
-
-		win = self.c_win_init()
+		self.c_win = self.c_win_init()
+		self.key_ts = None # to measure time from keypress until ui is ready for next one
+		self.c_redraw_ts, self.c_drawn = 0, (list(), None)
+		self.c_output_delay = None # set if c_output() was rate-limited
+		self.c_top = 0 # offset of first displayed item, see c_win_rows()
+		self.c_output_start, self.c_output_sec = time.monotonic(), None
+		self.c_output_bytes = self.c_output_sec_bytes = self.c_output_peak = 0
+		self.menu.stats.gauges['term_output'] = self.c_output_stats
+
+	def _run_draw(self):
+		'Updates and redraws menu, storing displayed (items, item_hl) in c_drawn.'
+		self.menu.stats.count('redraws')
+		items, item_hl = self.menu.item_list, self.item_hl
+		if item_hl is None: item_hl = self.item_hl = self.menu.item_default()
+		if item_hl not in items: item_hl = self.menu.item_default()
+		self.c_win_draw(self.c_win, items, item_hl)
+		self.c_output_delay = self.c_output()
+		if self.key_ts: self.menu.stats.add('keypress', time.perf_counter() - self.key_ts)
+		self.key_ts, self.c_drawn, self.c_redraw_ts = None, (items, item_hl), time.monotonic()
+
+	def _run_timeout(self, poll=None):
+		'''Redraws menu for pulse updates, if any, at most redraw-fps-max times per second,
+				and sends rate-limited output from previous redraw to terminal, if it's due.
+			Returns seconds until either of these has to be done, or None to wait for input/wakeup.
+			"poll" is max timeout to use while update() fetch is in progress, if not None.'''
+		timeouts, fps = list(), self.conf.redraw_fps_max
+		if self.menu.update_pending():
+			delay = fps and self.c_redraw_ts + 1.0 / fps - time.monotonic()
+			if delay > 0: timeouts.append(delay)
+			else: self._run_draw()
+		elif self.c_output_delay is not None: self.c_output_delay = self.c_output()
+		if self.c_output_delay is not None: timeouts.append(self.c_output_delay)
+		if poll is not None and self.menu.update_fetching(): timeouts.append(poll)
+		return min(timeouts) if timeouts else None
+
+	keys_read_max = 200 # max number of buffered keys to process before next redraw
+
+	def _run_keys_read(self, key):
+		'Returns list of keys, starting with specified one, and any others that are already buffered.'
+		keys = [key]
+		self.c_stdscr.timeout(0)
+		while len(keys) < self.keys_read_max:
+			try: key = self.c_stdscr.getch()
+			except KeyboardInterrupt: key = self.c_key('q')
+			except self.c.error: break
+			if key == -1: break
+			keys.append(key)
+		if len(keys) > 1: self.menu.stats.count('keys_buffered', len(keys) - 1)
+		return keys
+
+	def _run_keys(self, keys):
+		'''Handles keys from getch() for displayed items, returns False to exit ui loop.
+			Consecutive volume and mute keys for same item are folded into one volume/mute change,
+				so that e.g. buffered key-repeats of held-down key are applied as one action,
+				with the same end result as handling them one-by-one.'''
+		(items, item_hl), c, win = self.c_drawn, self.c, self.c_win
+		key_match = lambda key,*choices: key in map(self.c_key, choices)
 		adjust_step = self.conf.adjust_step / 100.0
-
-		while True:
-			items, item_hl = self.menu.item_list, self.item_hl
-			if item_hl is None: item_hl = self.item_hl = self.menu.item_default()
-			if item_hl not in items: item_hl = self.menu.item_default()
-			self.c_win_draw(win, items, item_hl)
-
-			key = None
-			while True:
-				try: key = win.getch()
-				except KeyboardInterrupt: key = self.c_key('q')
-				except c.error: break
-				try: key_name = c.keyname(key)
-				except ValueError: key_name = 'unknown' # e.g. "-1"
-				break
-			if key is None: continue
+		vol, mute = None, False # pending changes for item_hl
+
+		def apply_item():
+			nonlocal vol, mute
+			if vol is not None and vol != item_hl.volume: item_hl.volume_change(vol - item_hl.volume)
+			if mute: item_hl.muted_toggle()
+			vol, mute = None, False
+
+		self.key_ts = time.perf_counter()
+		for key in keys:
+			try: key_name = c.keyname(key)
+			except ValueError: key_name = 'unknown' # e.g. "-1"
 			log.debug('Keypress event: {} ({!r})', key, key_name)
 
 			if item_hl:
-				if key_match(key, 'up', 'k', 'p'): self.item_hl = item_hl.get_prev()
-				elif key_match(key, 'down', 'j', 'n'): self.item_hl = item_hl.get_next()
-				elif key_match(key, 'left', 'h', 'b'): item_hl.volume_change(-adjust_step)
-				elif key_match(key, 'right', 'l', 'f'): item_hl.volume_change(adjust_step)
-				elif key_match(key, ' ', 'm'): item_hl.muted_toggle()
+				if key_match(key, 'left', 'h', 'b', 'right', 'l', 'f'):
+					if vol is None: vol = item_hl.volume
+					vol += -adjust_step if key_match(key, 'left', 'h', 'b') else adjust_step
+					vol = min(1.0, max(0, vol))
+					continue
+				if key_match(key, ' ', 'm'):
+					mute = not mute
+					continue
+				apply_item()
+				if key_match(key, 'up', 'k', 'p'): self.item_hl = item_hl = item_hl.get_prev()
+				elif key_match(key, 'down', 'j', 'n'): self.item_hl = item_hl = item_hl.get_next()
+				elif key_match(key, 'ppage', 'npage'):
+					page = max(1, self.c_win_size(win)[0] - 2)
+					if key_match(key, 'ppage'): page = -page
+					self.item_hl = item_hl = self.menu.item_offset(item_hl, page)
+				elif key_match(key, 'home'): self.item_hl = item_hl = self.menu.item_offset(item_hl, -len(items))
+				elif key_match(key, 'end'): self.item_hl = item_hl = self.menu.item_offset(item_hl, len(items))
 				elif key_name.isdigit(): # 1-0 keyboard row
 					item_hl.volume = (float(key_name) or 10.0) / 10 # 0 is 100%
 
 			if key_match(key, 'resize'):
 				if self.conf.overkill_redraw:
 					c.endwin()
-					stdscr.refresh()
-					win = self.c_win_init()
+					self.c_stdscr.refresh()
+					self.c_win = win = self.c_win_init()
+				elif self.conf.output_mode == 'pad': self.c_win = win = self.c_win_init() # pad for new size
 				else:
 					win.resize(*win.getmaxyx())
-			elif key_match(key, 'q'): break
+			elif key_match(key, 'q'): return False
+
+		if item_hl: apply_item()
+		return True
+
+	# Wakeup signal can arrive right before getch() blocks, and not interrupt it,
+	#  so getch() timeout is used to check for fetched results while these are expected
+	wakeup_poll_interval = 0.1
+
+	def _run(self, stdscr):
+		self._run_init(stdscr)
+		self._run_draw()
+		while True:
+			timeout = self._run_timeout(self.wakeup_poll_interval)
+			self.c_stdscr.timeout(-1 if timeout is None else int(timeout * 1000) + 1)
+			try: key = self.c_stdscr.getch()
+			except KeyboardInterrupt: key = self.c_key('q')
+			except self.c.error: continue # interrupted by signal
+			if key == -1: continue # timeout
+			if not self._run_keys(self._run_keys_read(key)): break
+			self._run_draw()
 
 	def run(self):
 		import locale, curses # has a ton of global state
@@ -632,6 +1727,99 @@ class PAMixerUI(object):
 		self.c = curses
 		self.c.wrapper(self._run)
 
+	async def run_async(self, wakeup):
+		'''Same as run() for "asyncio" engine, with terminal input and resize/interrupt signals
+				handled in the event loop, and non-blocking getch() calls after these.
+			"wakeup" is an asyncio.Event, set when ui needs to be redrawn for pulse updates.'''
+		import locale, curses
+		locale.setlocale(locale.LC_ALL, '')
+		self.c, loop, sigs = curses, asyncio.get_running_loop(), set()
+		stdin_fd = sys.stdin.fileno()
+		stdscr = curses.initscr() # same init/cleanup as curses.wrapper()
+		try:
+			curses.noecho()
+			curses.cbreak()
+			stdscr.keypad(1)
+			try: curses.start_color()
+			except: pass
+			self._run_init(stdscr)
+
+			def sig_handler(sig):
+				sigs.add(sig)
+				wakeup.set()
+			loop.add_reader(stdin_fd, wakeup.set)
+			for sig in signal.SIGWINCH, signal.SIGINT: loop.add_signal_handler(sig, sig_handler, sig)
+			try:
+				self._run_draw()
+				while True:
+					wakeup.clear()
+					timeout = self._run_timeout()
+					if signal.SIGINT in sigs: break
+					if signal.SIGWINCH in sigs: # ncurses handler is replaced by the one above
+						sigs.discard(signal.SIGWINCH)
+						curses.resizeterm(*reversed(os.get_terminal_size(stdin_fd)))
+						key = self.c_key('resize')
+					else:
+						self.c_stdscr.nodelay(True)
+						key = self.c_stdscr.getch()
+					if key == -1:
+						if timeout is None: await wakeup.wait()
+						else:
+							try: await asyncio.wait_for(wakeup.wait(), timeout)
+							except asyncio.TimeoutError: pass
+						continue
+					if not self._run_keys(self._run_keys_read(key)): break
+					self._run_draw()
+					await asyncio.sleep(0) # let pulse i/o run between keypresses
+			finally:
+				loop.remove_reader(stdin_fd)
+				for sig in signal.SIGWINCH, signal.SIGINT: loop.remove_signal_handler(sig)
+		finally:
+			stdscr.keypad(0)
+			curses.echo()
+			curses.nocbreak()
+			curses.endwin()
+
+
+def stderr_close(conf):
+	'Any output will mess-up curses ui, so try to close sys.stderr if possible.'
+	if conf.verbose or conf.debug or conf.dump_stream_params: return
+	sys.stderr.flush()
+	fd = os.open(os.devnull, os.O_WRONLY)
+	os.dup2(fd, sys.stderr.fileno())
+	os.close(fd)
+
+async def main_async(conf, stats, names):
+	'Same connection/ui loop as in main(), but for "asyncio" engine.'
+	global PulseAsync
+	if not PulseAsync: from pulsectl_asyncio import PulseAsync
+	loop = asyncio.get_running_loop()
+	while True:
+		pulse = PulseAsync('pa-mixer-mk3')
+		try:
+			await pulse.connect(wait=conf.reconnect)
+
+			menu = PAMixerMenu( pulse, conf, fatal=conf.fatal,
+				stats=stats, names=names, io=PAMixerPulseAsyncIO(pulse, stats, loop) )
+			wakeup = asyncio.Event()
+
+			with menu.update_wakeup_tasks(menu.update_wakeup_handler, wakeup.set):
+				log.debug('Started pulse i/o and event tasks...')
+				with PAMixerUI(menu) as curses_ui:
+					stderr_close(conf)
+					log.debug('Entering curses ui loop...')
+					try: await curses_ui.run_async(wakeup)
+					except PAMixerReconnect:
+						menu.writes.close(flush=False)
+						if conf.reconnect: log.debug('Reconnecting to pulse server...')
+						else:
+							log.debug('Disconnected from pulse server, exiting...')
+							break
+					else:
+						writes = menu.writes.close()
+						if writes: await asyncio.wait([writes])
+						break
+		finally: pulse.close()
 
 def main(args=None):
 	conf = Conf()
@@ -658,6 +1846,27 @@ def main(args=None):
 		help='Exit when pulseaudio server connection goes down.'
 			' Default is to reconnect endlessly, i.e. run until manual exit.')
 
+	parser.add_argument('--engine',
+		choices=['threads', 'asyncio'], default=conf.engine,
+		help='Way to run pulse i/o alongside curses ui (default: %(default)s).'
+			' "threads" runs pulse requests in a separate thread, waking up ui via signals,'
+			' "asyncio" runs everything in one event loop, requires pulsectl_asyncio module.')
+
+	parser.add_argument('--output-mode',
+		choices=['direct', 'pad'], default=conf.output_mode,
+		help='How to send drawn ui to terminal (default: %(default)s).'
+			' "direct" sends every frame right away, "pad" draws into off-screen'
+			' curses pad and copies changes from it at most --output-fps-max times per second,'
+			' which can use less bandwidth with e.g. slow ssh links.')
+	parser.add_argument('--output-fps-max',
+		type=float, metavar='fps', default=conf.output_fps_max,
+		help='Max terminal updates per second with "pad" output mode, 0 - no limit (default: %(default)s).')
+	parser.add_argument('--events-connection',
+		action='store_true', default=conf.events_connection,
+		help='Use separate pulse connection and thread for listening to events with "threads" engine,'
+			' instead of interrupting event_listen() on the same connection for every request.'
+			' Does nothing with "asyncio" engine, where these do not block each other anyway.')
+
 	parser.add_argument('-v', '--verbose',
 		action='store_true', default=conf.verbose,
 		help='Dont close stderr to see any sort of errors (which'
@@ -683,11 +1892,20 @@ def main(args=None):
 	print = ft.partial(print, file=sys.stderr, flush=True) # stdout is used by curses
 	log.debug('Initializing...')
 
+	stats, names = PAMixerStats(), PAMixerNameRegistry()
+	if conf.engine == 'asyncio':
+		asyncio.run(main_async(conf, stats, names))
+		log.debug('Finished, stats: {}', stats)
+		return
 	while True:
-		with Pulse('pa-mixer-mk3', connect=False, threading_lock=True) as pulse:
+		with Pulse('pa-mixer-mk3', connect=False, threading_lock=True) as pulse,\
+				( Pulse('pa-mixer-mk3-events', connect=False, threading_lock=True)
+					if conf.events_connection else nullcontext() ) as pulse_events:
 			pulse.connect(wait=conf.reconnect)
+			if pulse_events: pulse_events.connect(wait=conf.reconnect)
 
-			menu = PAMixerMenu(pulse, conf, fatal=conf.fatal)
+			menu = PAMixerMenu( pulse, conf, fatal=conf.fatal,
+				stats=stats, names=names, io=PAMixerPulseIO(pulse, stats, pulse_events) )
 			wakeup_pid = os.getpid()
 
 			with menu.update_wakeup_poller(menu.update_wakeup_handler) as poller_thread:
@@ -695,21 +1913,22 @@ def main(args=None):
 				poller_thread.start()
 
 				with PAMixerUI(menu) as curses_ui:
-					# Any output will mess-up curses ui, so try to close sys.stderr if possible
-					if not conf.verbose and not conf.debug and not conf.dump_stream_params:
-						sys.stderr.flush()
-						fd = os.open(os.devnull, os.O_WRONLY)
-						os.dup2(fd, sys.stderr.fileno())
-						os.close(fd)
+					stderr_close(conf)
 					log.debug('Entering curses ui loop...')
 					try: curses_ui.run()
 					except PAMixerReconnect:
+						menu.writes.close(flush=False)
 						if conf.reconnect: log.debug('Reconnecting to pulse server...')
 						else:
 							log.debug('Disconnected from pulse server, exiting...')
 							break
-					else: break
+					else:
+						writes = menu.writes.close()
+						if writes:
+							try: writes.result()
+							except CancelledError: pass # pulse i/o thread stopped
+						break
 
-	log.debug('Finished')
+	log.debug('Finished, stats: {}', stats)
 
 if __name__ == '__main__': sys.exit(main())